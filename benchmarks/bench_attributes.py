@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+
+# This source file is part of mc4p,
+# the Minecraft Portable Protocol-Parsing Proxy.
+
+# This program is free software. It comes without any warranty, to
+# the extent permitted by applicable law. You can redistribute it
+# and/or modify it under the terms of the Do What The Fuck You Want
+# To Public License, Version 2, as published by Sam Hocevar. See
+# http://www.wtfpl.net/txt/copying/ for more details
+
+"""Reads packet attributes through field descriptors and through the
+__getattribute__ override they replaced."""
+
+from __future__ import (
+    division, absolute_import, print_function, unicode_literals)
+
+import timeit
+
+from mc4p import parsing, protocol
+
+from bench_codecs import PLAY, body
+
+
+def legacy(cls):
+    """Restores the old __getattribute__ based access on a packet class"""
+    def __getattribute__(self, attr):
+        value = super(cls, self).__getattribute__(attr)
+        if attr[0] == "_":
+            return value
+        if not self._parsed and attr in self._fields:
+            self._parse()
+            value = super(cls, self).__getattribute__(attr)
+        if isinstance(value, parsing.LazyJson):
+            value = self.__dict__[attr] = value.decode()
+        return value
+
+    namespace = dict((str(name), None) for name in cls._fields)
+    namespace[str("__slots__")] = (str("__dict__"),)
+    namespace[str("__getattribute__")] = __getattribute__
+    return type(str("Legacy" + cls.__name__), (cls,), namespace)
+
+
+def main(number=200000):
+    sample = PLAY.PlayerPositionAndLook(
+        x=1.0, y=2.0, z=3.0, yaw=0.0, pitch=0.0, flags=0, teleport_id=1)
+    raw = body(sample)
+    for cls in (legacy(sample.__class__), sample.__class__):
+        packet = cls(protocol.PacketData(raw[1:]))
+        packet._parse()
+        if "__dict__" in cls.__slots__:
+            # Values were parsed into the slots the field descriptors use
+            for name, slot in cls._storage.items():
+                packet.__dict__[name] = getattr(packet, slot)
+        field = min(timeit.repeat(
+            lambda: packet.x, number=number, repeat=3)) / number * 1e9
+        internal = min(timeit.repeat(
+            lambda: packet._dirty, number=number, repeat=3)) / number * 1e9
+        print("%-30s field: %6.1fns  internal: %6.1fns" % (
+            cls.__name__, field, internal))
+
+
+if __name__ == "__main__":
+    main()
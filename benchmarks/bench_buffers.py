@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+
+# This source file is part of mc4p,
+# the Minecraft Portable Protocol-Parsing Proxy.
+
+# This program is free software. It comes without any warranty, to
+# the extent permitted by applicable law. You can redistribute it
+# and/or modify it under the terms of the Do What The Fuck You Want
+# To Public License, Version 2, as published by Sam Hocevar. See
+# http://www.wtfpl.net/txt/copying/ for more details
+
+"""Receives a mix of small and chunk sized frames, then idles.
+
+Prints the receive throughput, the size the input buffer grew to and the
+size it's back at after idling, for recvs returning up to a given number
+of bytes. Input buffers used to be a fixed 1 MiB each.
+"""
+
+from __future__ import (
+    division, absolute_import, print_function, unicode_literals)
+
+import time
+
+from mc4p import parsing, protocol, stream
+
+from bench_chunk import full_column
+from bench_codecs import PLAY, body, player_list_item
+
+RECV_SIZES = (1 << 12, 1 << 14, 1 << 16, 1 << 20)
+ROUNDS = 20
+REPEAT = 5
+
+
+class FeedSocket(object):
+    def __init__(self, data, recv_size):
+        self.data = memoryview(data)
+        self.recv_size = recv_size
+
+    def recv_into(self, buf):
+        n = min(len(buf), len(self.data), self.recv_size)
+        buf[:n] = self.data[:n]
+        self.data = self.data[n:]
+        return n
+
+
+def frame(packet):
+    data = body(packet)
+    return parsing.VarInt.emit(len(data)) + data
+
+
+def traffic():
+    column, mask = full_column(states=40)
+    chunk = frame(PLAY.ChunkData(chunk_x=0, chunk_z=0,
+                                 ground_up_continous=True,
+                                 primary_bit_mask=mask, data=column))
+    small = frame(PLAY.KeepAlive(keep_alive_id=1))
+    players = frame(player_list_item())
+    frames = [chunk] + [small, players] * 50
+    return b"".join(frames * ROUNDS), len(frames) * ROUNDS
+
+
+def receive(input_stream, sock, count):
+    received = 0
+    peak = 0
+    while received < count:
+        input_stream.recv_from(sock)
+        peak = max(peak, len(input_stream.buf))
+        for packet in input_stream.read_packets():
+            received += 1
+    return peak
+
+
+def main():
+    wire, count = traffic()
+    idle = frame(PLAY.KeepAlive(keep_alive_id=2))
+    print("%10s %10s %12s %12s" % ("recv size", "MB/s", "peak buffer",
+                                   "idle buffer"))
+    for recv_size in RECV_SIZES:
+        elapsed = float("inf")
+        for i in range(REPEAT):
+            input_stream = stream.BufferedPacketInputStream(
+                protocol.Direction.client_bound, 109)
+            input_stream.context = PLAY
+            input_stream.interesting_ids = lambda context: frozenset()
+
+            start = time.time()
+            peak = receive(input_stream, FeedSocket(wire, recv_size), count)
+            elapsed = min(elapsed, time.time() - start)
+        for i in range(10):
+            receive(input_stream, FeedSocket(idle, recv_size), 1)
+        print("%10d %10.1f %12d %12d" % (
+            recv_size, len(wire) / elapsed / 1e6, peak,
+            len(input_stream.buf)))
+
+
+if __name__ == "__main__":
+    main()
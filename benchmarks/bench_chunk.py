@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+
+# This source file is part of mc4p,
+# the Minecraft Portable Protocol-Parsing Proxy.
+
+# This program is free software. It comes without any warranty, to
+# the extent permitted by applicable law. You can redistribute it
+# and/or modify it under the terms of the Do What The Fuck You Want
+# To Public License, Version 2, as published by Sam Hocevar. See
+# http://www.wtfpl.net/txt/copying/ for more details
+
+"""Decodes and re-encodes every section of a full chunk column."""
+
+from __future__ import (
+    division, absolute_import, print_function, unicode_literals)
+
+import random
+import timeit
+
+from mc4p import chunk
+
+
+def full_column(legacy=False, states=20):
+    random.seed(0)
+    column = chunk.ChunkColumn(b"\x01" * chunk.BIOMES_SIZE, 0, True, True,
+                               legacy=legacy)
+    for y in range(chunk.SECTIONS):
+        section = chunk.ChunkSection.empty()
+        palette = [random.randrange(4096) << 4 for i in range(states)]
+        section.blocks = chunk._new_blocks(
+            [random.choice(palette) for i in range(chunk.BLOCKS)])
+        column[y] = section
+    return column.encode(), column.primary_bit_mask
+
+
+def main(number=5):
+    numpy = chunk.numpy
+    for legacy in (False, True):
+        raw, mask = full_column(legacy)
+
+        def roundtrip():
+            column = chunk.ChunkColumn(raw, mask, legacy=legacy)
+            for y in column:
+                column[y]
+            assert column.encode() == raw
+
+        for backend in (numpy, None):
+            if backend is None and numpy is None:
+                continue
+            chunk.numpy = backend
+            elapsed = min(timeit.repeat(roundtrip, number=number, repeat=3))
+            print("%-8s %-12s %8.2fms per column" % (
+                "legacy" if legacy else "paletted",
+                "numpy" if backend else "array.array",
+                elapsed / number * 1e3))
+    chunk.numpy = numpy
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+
+# This source file is part of mc4p,
+# the Minecraft Portable Protocol-Parsing Proxy.
+
+# This program is free software. It comes without any warranty, to
+# the extent permitted by applicable law. You can redistribute it
+# and/or modify it under the terms of the Do What The Fuck You Want
+# To Public License, Version 2, as published by Sam Hocevar. See
+# http://www.wtfpl.net/txt/copying/ for more details
+
+"""Compares generic and compiled per-packet codecs."""
+
+from __future__ import (
+    division, absolute_import, print_function, unicode_literals)
+
+import os
+import timeit
+import uuid
+
+from mc4p import parsing
+from mc4p import protocol
+from mc4p import util
+from mc4p.protocols import protocol109
+
+
+PLAY = protocol109.protocol.client_bound.play
+
+
+def player_list_item(players=20):
+    packet = PLAY.PlayerListItem(action=0)
+    field = PLAY.PlayerListItem._fields["players"]
+    add_player = field._item.subfields["data"].valdict[0]
+    item = add_player.subfields["properties"]._item
+
+    packet.players = field.parse(protocol.PacketData(b"\x00"), packet)
+    for i in range(players):
+        player = field._item.new_dummy(packet.players)
+        player.uuid = uuid.UUID(int=i)
+        player.data = add_player.new_dummy(player)
+        player.data.name = "player%d" % i
+        player.data.properties = [item.new_dummy(None)]
+        player.data.properties[0].name = "textures"
+        player.data.properties[0].value = "x" * 300
+        player.data.properties[0].is_signed = False
+        player.data.gamemode = 0
+        player.data.ping = 42
+        player.data.has_display_name = False
+        packet.players.append(player)
+    return packet
+
+
+SAMPLES = (
+    PLAY.PlayerPositionAndLook(x=1.5, y=64.0, z=-3.25, yaw=90.0, pitch=0.0,
+                               flags=0, teleport_id=1),
+    player_list_item(),
+    PLAY.ChunkData(chunk_x=1, chunk_z=2, ground_up_continous=True,
+                   primary_bit_mask=0xff, data=os.urandom(1 << 15)),
+)
+
+
+def body(packet):
+    """Returns the packet id and fields without the length prefix"""
+    data = protocol.PacketData(
+        memoryview(util.combine_memoryview(packet._emit())))
+    parsing.VarInt.parse(data)
+    return data.read_bytes().tobytes()
+
+
+def recompile(cls, enabled):
+    cls._compile_codecs = enabled
+    cls._do_magic(cls._context)
+
+
+def bench(cls, raw, number):
+    def parse():
+        packet = PLAY.read_packet(protocol.PacketData(raw))
+        packet._parse()
+        return packet
+
+    packet = parse()
+
+    def encode():
+        packet._encode()
+
+    return (min(timeit.repeat(parse, number=number, repeat=3)) / number,
+            min(timeit.repeat(encode, number=number, repeat=3)) / number)
+
+
+def main(number=2000):
+    for sample in SAMPLES:
+        cls = sample.__class__
+        raw = body(sample)
+        results = {}
+        for enabled in (False, True):
+            recompile(cls, enabled)
+            results[enabled] = bench(cls, raw, number)
+        print("%-24s parse: %6.2fus -> %6.2fus   encode: %6.2fus -> %6.2fus" %
+              (cls.__name__,
+               results[False][0] * 1e6, results[True][0] * 1e6,
+               results[False][1] * 1e6, results[True][1] * 1e6))
+
+
+if __name__ == "__main__":
+    main()
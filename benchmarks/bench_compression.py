@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+# This source file is part of mc4p,
+# the Minecraft Portable Protocol-Parsing Proxy.
+
+# This program is free software. It comes without any warranty, to
+# the extent permitted by applicable law. You can redistribute it
+# and/or modify it under the terms of the Do What The Fuck You Want
+# To Public License, Version 2, as published by Sam Hocevar. See
+# http://www.wtfpl.net/txt/copying/ for more details
+
+"""Compresses ChunkData packets at every zlib level and strategy, and
+adaptively.
+
+Captured packet bodies can be passed as file names, otherwise generated
+chunk columns are used.
+"""
+
+from __future__ import (
+    division, absolute_import, print_function, unicode_literals)
+
+import sys
+import timeit
+
+from mc4p import compression
+
+from bench_chunk import full_column
+from bench_codecs import PLAY, body
+
+
+def generated_payloads():
+    payloads = []
+    for states in (2, 8, 40):
+        data, mask = full_column(states=states)
+        payloads.append(body(PLAY.ChunkData(
+            chunk_x=0, chunk_z=0, ground_up_continous=True,
+            primary_bit_mask=mask, data=data)))
+    return payloads
+
+
+def bench(compressor, payloads, number):
+    size = sum(len(payload) for payload in payloads)
+    compressed = sum(len(compressor.compress([payload]))
+                     for payload in payloads)
+
+    def run():
+        for payload in payloads:
+            compressor.compress([payload])
+    elapsed = min(timeit.repeat(run, number=number, repeat=3)) / number
+    return size / elapsed / 1e6, size / compressed
+
+
+def main(number=3):
+    if len(sys.argv) > 1:
+        payloads = [open(name, "rb").read() for name in sys.argv[1:]]
+    else:
+        payloads = generated_payloads()
+
+    for level in range(0, 10):
+        for name, strategy in sorted(compression.STRATEGIES.items()):
+            speed, ratio = bench(compression.Compressor(level, strategy),
+                                 payloads, number)
+            print("level %d %-12s %8.1f MB/s  ratio %5.2f" % (
+                level, name, speed, ratio))
+    adaptive = compression.AdaptiveCompressor()
+    speed, ratio = bench(adaptive, payloads, number * 10)
+    print("adaptive, settled at level %d: %8.1f MB/s  ratio %5.2f" % (
+        adaptive.level, speed, ratio))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+
+# This source file is part of mc4p,
+# the Minecraft Portable Protocol-Parsing Proxy.
+
+# This program is free software. It comes without any warranty, to
+# the extent permitted by applicable law. You can redistribute it
+# and/or modify it under the terms of the Do What The Fuck You Want
+# To Public License, Version 2, as published by Sam Hocevar. See
+# http://www.wtfpl.net/txt/copying/ for more details
+
+"""Sends small packets over an encrypted connection at 10k packets/s.
+
+At that rate a flush every millisecond carries ten packets. Prints the CPU
+time per packet and the share of a core one connection needs, encrypting
+each flush at once and, like before, each packet on its own.
+"""
+
+from __future__ import (
+    division, absolute_import, print_function, unicode_literals)
+
+import os
+import timeit
+
+from mc4p import compression, encryption, protocol, stream, util
+
+from bench_codecs import PLAY
+
+RATE = 10000
+FLUSHES_PER_SECOND = 1000
+THRESHOLD = 256
+
+
+class NullSocket(object):
+    def sendall(self, data):
+        pass
+
+
+class PerPacketOutputStream(stream.BufferedPacketOutputStream):
+    """Encrypts every packet with its own cipher call, as flush used to"""
+    def _encrypt_packet(self, segments):
+        return [self._cipher.encrypt(b"".join(
+            segment.tobytes() if isinstance(segment, memoryview)
+            else segment for segment in segments))]
+
+    def flush(self, sock):
+        pending, self.pending = self.pending, []
+        self.bytes_used = 0
+        segments = []
+        for entry in pending:
+            if isinstance(entry, compression.Job):
+                entry = entry.result()
+            segments.extend(self._encrypt_packet(entry))
+        self.send_calls += util.send_segments(sock, segments)
+        self.packets_sent += len(pending)
+
+
+def packets():
+    return [
+        PLAY.KeepAlive(keep_alive_id=1),
+        PLAY.PlayerPositionAndLook(x=1.0, y=64.0, z=-3.5, yaw=90.0,
+                                   pitch=0.0, flags=0, teleport_id=7),
+        PLAY.ChatMessage(message={"text": "hello"}, position=0),
+    ]
+
+
+def bench(cls, backend, batch, number=2000):
+    output_stream = cls(protocol.Direction.client_bound, 109)
+    output_stream.context = PLAY
+    output_stream._compression_threshold = THRESHOLD
+    output_stream._cipher = encryption.AES128CFB8(os.urandom(16), backend)
+    sock = NullSocket()
+    small = packets()
+
+    def run():
+        for i in range(batch):
+            output_stream.send(sock, small[i % len(small)])
+        output_stream.flush(sock)
+    return min(timeit.repeat(run, number=number, repeat=3)) / number / batch
+
+
+def main():
+    batch = RATE // FLUSHES_PER_SECOND
+    print("%-14s %18s %18s" % ("backend", "per packet", "per flush"))
+    for backend in encryption.CIPHER_BACKENDS:
+        old = bench(PerPacketOutputStream, backend, batch)
+        new = bench(stream.BufferedPacketOutputStream, backend, batch)
+        print("%-14s %7.2fus %6.1f%% %7.2fus %6.1f%%" % (
+            backend, old * 1e6, old * RATE * 100,
+            new * 1e6, new * RATE * 100))
+
+
+if __name__ == "__main__":
+    main()
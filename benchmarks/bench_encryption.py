@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+
+# This source file is part of mc4p,
+# the Minecraft Portable Protocol-Parsing Proxy.
+
+# This program is free software. It comes without any warranty, to
+# the extent permitted by applicable law. You can redistribute it
+# and/or modify it under the terms of the Do What The Fuck You Want
+# To Public License, Version 2, as published by Sam Hocevar. See
+# http://www.wtfpl.net/txt/copying/ for more details
+
+"""Measures AES128-CFB8 throughput of every available cipher backend.
+
+Buffers of several sizes are decrypted in place, the way input streams do
+it, and the same way as before, copying the data out and the plaintext
+back in.
+"""
+
+from __future__ import (
+    division, absolute_import, print_function, unicode_literals)
+
+import os
+import timeit
+
+from mc4p import encryption
+
+SIZES = (64, 1 << 10, 1 << 14, 1 << 20)
+TOTAL = 1 << 22
+
+
+def bench(backend, size, in_place):
+    cipher = encryption.AES128CFB8(os.urandom(16), backend)
+    buf = memoryview(bytearray(os.urandom(size + encryption.OUTPUT_SLACK)))
+    part = buf[:size]
+    number = max(1, TOTAL // size)
+
+    if in_place:
+        def run():
+            cipher.decrypt_into(part, buf)
+    else:
+        def run():
+            part[:] = cipher.decrypt(part.tobytes())
+    elapsed = min(timeit.repeat(run, number=number, repeat=3)) / number
+    return size / elapsed / 1e6
+
+
+def main():
+    print("%-14s %8s %12s %12s" % ("backend", "size", "copy MB/s",
+                                   "in place MB/s"))
+    for backend in encryption.CIPHER_BACKENDS:
+        for size in SIZES:
+            print("%-14s %8d %12.1f %12.1f" % (
+                backend, size, bench(backend, size, False),
+                bench(backend, size, True)))
+
+
+if __name__ == "__main__":
+    main()
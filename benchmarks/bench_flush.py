@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+# This source file is part of mc4p,
+# the Minecraft Portable Protocol-Parsing Proxy.
+
+# This program is free software. It comes without any warranty, to
+# the extent permitted by applicable law. You can redistribute it
+# and/or modify it under the terms of the Do What The Fuck You Want
+# To Public License, Version 2, as published by Sam Hocevar. See
+# http://www.wtfpl.net/txt/copying/ for more details
+
+"""Forwards small packets in batches the way the proxy does.
+
+Every batch of one to four packets ends with schedule_flush, as after each
+recv. Prints the throughput and send calls per packet for several flush
+delays, None being a flush after every batch.
+"""
+
+from __future__ import (
+    division, absolute_import, print_function, unicode_literals)
+
+import random
+import socket
+import threading
+import time
+
+from mc4p import protocol, stream
+
+from bench_codecs import PLAY
+
+PACKETS = 50000
+DELAYS = (None, 0, 0.0005, 0.002)
+
+
+def drain(sock):
+    while sock.recv(1 << 16):
+        pass
+
+
+def forward(delay):
+    sender, receiver = socket.socketpair()
+    reader = threading.Thread(target=drain, args=(receiver,))
+    reader.start()
+
+    output_stream = stream.BufferedPacketOutputStream(
+        protocol.Direction.client_bound, 109)
+    output_stream.context = PLAY
+    output_stream.flush_delay = delay
+    packet = PLAY.KeepAlive(keep_alive_id=1)
+
+    random.seed(0)
+    start = time.time()
+    sent = 0
+    while sent < PACKETS:
+        for i in range(random.randint(1, 4)):
+            output_stream.send(sender, packet)
+            sent += 1
+        output_stream.schedule_flush(sender)
+    output_stream.flush(sender)
+    elapsed = time.time() - start
+
+    sender.shutdown(socket.SHUT_WR)
+    reader.join()
+    sender.close()
+    receiver.close()
+    return sent / elapsed, output_stream.send_calls_per_packet
+
+
+def main():
+    print("%-8s %12s %14s" % ("delay", "packets/s", "calls/packet"))
+    for delay in DELAYS:
+        rate, calls = forward(delay)
+        print("%-8s %12.0f %14.3f" % (delay, rate, calls))
+
+
+if __name__ == "__main__":
+    main()
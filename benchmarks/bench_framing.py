@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+# This source file is part of mc4p,
+# the Minecraft Portable Protocol-Parsing Proxy.
+
+# This program is free software. It comes without any warranty, to
+# the extent permitted by applicable law. You can redistribute it
+# and/or modify it under the terms of the Do What The Fuck You Want
+# To Public License, Version 2, as published by Sam Hocevar. See
+# http://www.wtfpl.net/txt/copying/ for more details
+
+"""Splits a recv worth of small play packets into frames.
+
+Compares read_packets, which splits all frames at once, against calling
+read_packet until the data runs out. Packets are read as raw frames, like
+a proxy without handlers does, so the framing dominates.
+"""
+
+from __future__ import (
+    division, absolute_import, print_function, unicode_literals)
+
+import timeit
+
+from mc4p import parsing, protocol, stream
+
+from bench_codecs import PLAY, body
+
+COUNTS = (10, 100, 500)
+
+
+def frames(count, threshold):
+    packet = PLAY.PlayerPositionAndLook(x=1.0, y=64.0, z=-3.5, yaw=90.0,
+                                        pitch=0.0, flags=0, teleport_id=7)
+    data = body(packet)
+    if threshold is not None:
+        data = parsing.VarInt.emit(0) + data
+    return (parsing.VarInt.emit(len(data)) + data) * count
+
+
+def new_stream(wire, threshold):
+    input_stream = stream.BufferedPacketInputStream(
+        protocol.Direction.client_bound, 109)
+    input_stream.context = PLAY
+    input_stream._compression_threshold = threshold
+    input_stream.interesting_ids = lambda context: frozenset()
+    input_stream._replace(len(wire))
+    input_stream.buf[:len(wire)] = wire
+    return input_stream
+
+
+def one_by_one(input_stream):
+    try:
+        while True:
+            input_stream.read_packet()
+    except stream.PartialPacketException:
+        pass
+
+
+def batched(input_stream):
+    for packet in input_stream.read_packets():
+        pass
+
+
+def bench(read, wire, threshold, number):
+    input_stream = new_stream(wire, threshold)
+
+    def run():
+        input_stream.read_pos = 0
+        input_stream.write_pos = len(wire)
+        read(input_stream)
+    return min(timeit.repeat(run, number=number, repeat=3)) / number
+
+
+def main(number=200):
+    print("%6s %12s %12s %12s" % ("count", "compressed", "one by one",
+                                  "batched"))
+    for count in COUNTS:
+        for threshold in (None, 256):
+            wire = frames(count, threshold)
+            print("%6d %12s %10.2fus %10.2fus" % (
+                count, threshold is not None,
+                bench(one_by_one, wire, threshold, number) * 1e6 / count,
+                bench(batched, wire, threshold, number) * 1e6 / count))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+# This source file is part of mc4p,
+# the Minecraft Portable Protocol-Parsing Proxy.
+
+# This program is free software. It comes without any warranty, to
+# the extent permitted by applicable law. You can redistribute it
+# and/or modify it under the terms of the Do What The Fuck You Want
+# To Public License, Version 2, as published by Sam Hocevar. See
+# http://www.wtfpl.net/txt/copying/ for more details
+
+"""Inflates compressed ChunkData packets of growing size.
+
+The time per megabyte should stay flat for CompressedData, while inflating
+in 128 byte steps onto an immutable string grows with the packet size.
+Reading just the packet id should take the same time at every size.
+"""
+
+from __future__ import (
+    division, absolute_import, print_function, unicode_literals)
+
+import timeit
+import zlib
+
+from mc4p import protocol
+from mc4p.stream import CompressedData
+
+from bench_chunk import full_column
+from bench_codecs import PLAY, body
+
+SIZES = (1 << 16, 1 << 18, 1 << 19, 1 << 20, 1 << 21)
+# The old decompressor is too slow to wait for beyond this size
+LEGACY_LIMIT = 1 << 20
+
+
+class LegacyCompressedData(object):
+    """The decompressor CompressedData replaced, for comparison"""
+    CHUNK_SIZE = 128
+
+    def __init__(self, data, uncompressed_length):
+        self.data = data
+        self.length = uncompressed_length
+        self.read_pos = 0
+        self.decompressed_data = b""
+        self.decompress_object = zlib.decompressobj()
+
+    def decompress(self, length):
+        while length + self.read_pos > len(self.decompressed_data):
+            limit = min(self.CHUNK_SIZE,
+                        len(self.data) - self.data.read_pos)
+            if limit <= 0:
+                raise IOError("Buffer underflow")
+            chunk = self.data.read_bytes(limit).tobytes()
+            if self.decompress_object.unconsumed_tail:
+                chunk = self.decompress_object.unconsumed_tail + chunk
+            self.decompressed_data += self.decompress_object.decompress(chunk)
+
+    def read(self):
+        self.decompress(self.length - self.read_pos)
+        return memoryview(self.decompressed_data)
+
+
+def payload(size):
+    # Repeat a chunk column up to size, ChunkData doesn't check its length
+    column, mask = full_column(states=40)
+    data = (column * (size // len(column) + 1))[:size]
+    packet = body(PLAY.ChunkData(chunk_x=0, chunk_z=0,
+                                 ground_up_continous=True,
+                                 primary_bit_mask=mask, data=data))
+    return zlib.compress(packet), len(packet)
+
+
+def bench(cls, compressed, length, number, whole=True):
+    def run():
+        data = cls(protocol.PacketData(memoryview(compressed)), length)
+        if whole:
+            data.read()
+        else:
+            data.read_varint()
+    return min(timeit.repeat(run, number=number, repeat=3)) / number
+
+
+def main():
+    print("%9s %14s %14s %12s" % ("size", "inflate ms/MB", "legacy ms/MB",
+                                  "packet id us"))
+    for size in SIZES:
+        compressed, length = payload(size)
+        number = max(1, (1 << 22) // size)
+        megabytes = length / 1e6
+
+        new = bench(CompressedData, compressed, length, number)
+        if size <= LEGACY_LIMIT:
+            legacy = "%14.2f" % (bench(LegacyCompressedData, compressed,
+                                       length, 1) * 1e3 / megabytes)
+        else:
+            legacy = "%14s" % "-"
+        packet_id = bench(CompressedData, compressed, length, 1000,
+                          whole=False)
+        print("%9d %14.2f %s %12.1f" % (length, new * 1e3 / megabytes,
+                                        legacy, packet_id * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+
+# This source file is part of mc4p,
+# the Minecraft Portable Protocol-Parsing Proxy.
+
+# This program is free software. It comes without any warranty, to
+# the extent permitted by applicable law. You can redistribute it
+# and/or modify it under the terms of the Do What The Fuck You Want
+# To Public License, Version 2, as published by Sam Hocevar. See
+# http://www.wtfpl.net/txt/copying/ for more details
+
+"""Rewrites one player of a large PlayerListItem with eager and lazy arrays."""
+
+from __future__ import (
+    division, absolute_import, print_function, unicode_literals)
+
+import timeit
+
+from mc4p import protocol
+from mc4p import util
+
+from bench_codecs import PLAY, body, player_list_item
+
+
+def main(players=200, number=200):
+    raw = body(player_list_item(players))
+    field = PLAY.PlayerListItem._fields["players"]
+
+    def rewrite():
+        packet = PLAY.read_packet(protocol.PacketData(raw))
+        packet.players[players // 2].data.properties[0].value = "y" * 300
+        util.combine_memoryview(packet._emit())
+
+    for lazy in (False, True):
+        field._lazy = lazy
+        elapsed = min(timeit.repeat(rewrite, number=number, repeat=3))
+        print("%d players, lazy=%-5s %8.1fus per packet" % (
+            players, lazy, elapsed / number * 1e6))
+
+
+if __name__ == "__main__":
+    main()
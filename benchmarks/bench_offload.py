@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+
+# This source file is part of mc4p,
+# the Minecraft Portable Protocol-Parsing Proxy.
+
+# This program is free software. It comes without any warranty, to
+# the extent permitted by applicable law. You can redistribute it
+# and/or modify it under the terms of the Do What The Fuck You Want
+# To Public License, Version 2, as published by Sam Hocevar. See
+# http://www.wtfpl.net/txt/copying/ for more details
+
+"""Sends and receives a burst of ChunkData packets with and without zlib
+worker threads.
+
+The packets are compressed by a BufferedPacketOutputStream and inflated by
+a BufferedPacketInputStream, both on sockets that don't do any I/O.
+"""
+
+from __future__ import (
+    division, absolute_import, print_function, unicode_literals)
+
+import timeit
+
+from mc4p import compression, protocol, stream
+
+from bench_chunk import full_column
+from bench_codecs import PLAY
+
+BURST = 32
+THRESHOLD = 256
+
+
+class NullSocket(object):
+    def __init__(self, data=b""):
+        self.data = memoryview(data)
+        self.sent = []
+
+    def sendall(self, data):
+        self.sent.append(memoryview(data).tobytes())
+
+    def recv_into(self, buf):
+        n = min(len(buf), len(self.data))
+        buf[:n] = self.data[:n]
+        self.data = self.data[n:]
+        return n
+
+
+def packets():
+    data, mask = full_column(states=40)
+    return [PLAY.ChunkData(chunk_x=i, chunk_z=0, ground_up_continous=True,
+                           primary_bit_mask=mask, data=data)
+            for i in range(BURST)]
+
+
+def new_stream(cls, workers):
+    s = cls(protocol.Direction.client_bound, 109)
+    s.context = PLAY
+    s._compression_threshold = THRESHOLD
+    s.workers = workers
+    return s
+
+
+def send(burst, workers):
+    sock = NullSocket()
+    output_stream = new_stream(stream.BufferedPacketOutputStream, workers)
+    for packet in burst:
+        # Make every packet be encoded and compressed again
+        packet.chunk_x = packet.chunk_x
+        output_stream.send(sock, packet)
+    output_stream.flush(sock)
+    return b"".join(sock.sent)
+
+
+def receive(wire, workers):
+    sock = NullSocket(wire)
+    input_stream = new_stream(stream.BufferedPacketInputStream, workers)
+    received = 0
+    while received < BURST:
+        input_stream.recv_from(sock)
+        for packet in input_stream.read_packets():
+            len(packet.data)
+            received += 1
+
+
+def main(number=5):
+    burst = packets()
+    wire = send(burst, None)
+    size = BURST * len(burst[0].data) / 1e6
+    for threads in (None, 1, 2, 4, 8):
+        workers = threads and compression.WorkerPool(threads)
+        sending = min(timeit.repeat(lambda: send(burst, workers),
+                                    number=number, repeat=3)) / number
+        receiving = min(timeit.repeat(lambda: receive(wire, workers),
+                                      number=number, repeat=3)) / number
+        print("%-7s compress %7.1f MB/s  inflate %7.1f MB/s" % (
+            threads or "inline", size / sending, size / receiving))
+
+
+if __name__ == "__main__":
+    main()
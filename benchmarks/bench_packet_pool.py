@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+# This source file is part of mc4p,
+# the Minecraft Portable Protocol-Parsing Proxy.
+
+# This program is free software. It comes without any warranty, to
+# the extent permitted by applicable law. You can redistribute it
+# and/or modify it under the terms of the Do What The Fuck You Want
+# To Public License, Version 2, as published by Sam Hocevar. See
+# http://www.wtfpl.net/txt/copying/ for more details
+
+"""
+Counts the allocations of reading and forwarding hot packets through a
+BufferedPacketOutputStream, with slotted packets, pooled slotted packets
+and equivalent objects carrying an instance dict.
+"""
+
+from __future__ import (
+    division, absolute_import, print_function, unicode_literals)
+
+import sys
+import timeit
+
+from mc4p import protocol, stream
+
+from bench_codecs import PLAY, body
+
+
+SAMPLES = (
+    PLAY.KeepAlive(keep_alive_id=42),
+    PLAY.PlayerPositionAndLook(x=1.5, y=64.0, z=-3.25, yaw=90.0, pitch=0.0,
+                               flags=0, teleport_id=1),
+)
+# Packets forwarded between flushes
+BURST = 50
+
+
+class DictPacket(object):
+    """Stand-in for the previous dict based Packet"""
+
+
+class NullSocket(object):
+    def sendall(self, data):
+        pass
+
+
+def dict_size(packet):
+    legacy = DictPacket()
+    for name in protocol.Packet.__slots__ + packet.__slots__:
+        setattr(legacy, name, getattr(packet, name, None))
+    return sys.getsizeof(legacy) + sys.getsizeof(legacy.__dict__)
+
+
+def main(number=200):
+    sock = NullSocket()
+    for sample in SAMPLES:
+        cls = sample.__class__
+        raw = body(sample)
+        output_stream = stream.BufferedPacketOutputStream(
+            protocol.Direction.client_bound, 109)
+        output_stream.context = PLAY
+        # Read by the "handler", which parses the packet
+        field = next(iter(cls._fields))
+        allocations = [0]
+        init = cls.__init__
+
+        def counting_init(self, *args, **kwargs):
+            allocations[0] += 1
+            init(self, *args, **kwargs)
+
+        def forward():
+            for i in range(BURST):
+                packet = PLAY.read_packet(protocol.PacketData(raw))
+                getattr(packet, field)
+                output_stream.send(sock, packet)
+            output_stream.flush(sock)
+
+        packets = number * BURST * 3
+        results = {}
+        for pooled in (False, True):
+            if pooled:
+                cls._enable_pool(BURST)
+            cls.__init__ = counting_init
+            try:
+                allocations[0] = 0
+                elapsed = min(timeit.repeat(forward, number=number, repeat=3))
+            finally:
+                cls.__init__ = init
+                cls._disable_pool()
+            results[pooled] = (allocations[0], elapsed / (number * BURST))
+
+        print("%s, %d packets" % (cls.__name__, packets))
+        print("  %-8s %6d objects  %4d bytes each" % (
+            "dict", 2 * results[False][0], dict_size(sample)))
+        for pooled in (False, True):
+            count, elapsed = results[pooled]
+            print("  %-8s %6d objects  %4d bytes each  %6.2fus per packet" % (
+                "pooled" if pooled else "slotted", count,
+                sys.getsizeof(sample), elapsed * 1e6))
+
+
+if __name__ == "__main__":
+    main()
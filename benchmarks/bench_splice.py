@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+# This source file is part of mc4p,
+# the Minecraft Portable Protocol-Parsing Proxy.
+
+# This program is free software. It comes without any warranty, to
+# the extent permitted by applicable law. You can redistribute it
+# and/or modify it under the terms of the Do What The Fuck You Want
+# To Public License, Version 2, as published by Sam Hocevar. See
+# http://www.wtfpl.net/txt/copying/ for more details
+
+"""Changes one field of a large packet with full and spliced re-encoding."""
+
+from __future__ import (
+    division, absolute_import, print_function, unicode_literals)
+
+import os
+import timeit
+
+from mc4p import protocol
+
+from bench_codecs import PLAY, body
+
+
+SAMPLES = (
+    (PLAY.PluginMessage(channel="MC|Brand", data=os.urandom(30 << 10)),
+     lambda packet: setattr(packet, "channel", "REGISTER")),
+    (PLAY.ChunkData(chunk_x=0, chunk_z=0, ground_up_continous=True,
+                    primary_bit_mask=0xffff, data=os.urandom(100 << 10)),
+     lambda packet: setattr(packet, "chunk_x", packet.chunk_x + 16)),
+)
+
+
+def main(number=500):
+    for sample, modify in SAMPLES:
+        cls = sample.__class__
+        raw = body(sample)
+
+        def rewrite():
+            packet = PLAY.read_packet(protocol.PacketData(raw))
+            modify(packet)
+            packet._emit_segments()
+
+        results = []
+        for spliceable in (False, True):
+            cls._spliceable = spliceable
+            results.append(min(timeit.repeat(
+                rewrite, number=number, repeat=3)) / number * 1e6)
+        print("%-16s %6d bytes  full: %8.1fus  spliced: %8.1fus" % (
+            cls.__name__, len(raw), results[0], results[1]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+# This source file is part of mc4p,
+# the Minecraft Portable Protocol-Parsing Proxy.
+
+# This program is free software. It comes without any warranty, to
+# the extent permitted by applicable law. You can redistribute it
+# and/or modify it under the terms of the Do What The Fuck You Want
+# To Public License, Version 2, as published by Sam Hocevar. See
+# http://www.wtfpl.net/txt/copying/ for more details
+
+"""
+Reports the memory of a fully decoded PlayerListItem with slotted SubFields
+classes, compared to equivalent objects carrying an instance dict.
+"""
+
+from __future__ import (
+    division, absolute_import, print_function, unicode_literals)
+
+import gc
+import sys
+import types
+
+from mc4p import parsing
+from mc4p import protocol
+
+from bench_codecs import PLAY, body, player_list_item
+
+
+class DictSubFields(object):
+    """Stand-in for the previous dict based _SubFields"""
+
+
+def dict_size(obj):
+    legacy = DictSubFields()
+    for name in ("_parent", "_type", "_is_ready") + obj.__slots__:
+        setattr(legacy, name, getattr(obj, name))
+    return sys.getsizeof(legacy) + sys.getsizeof(legacy.__dict__)
+
+
+def deep_size(root):
+    """Returns the (slotted, dict based) size of everything below root"""
+    seen = set()
+    stack = [root]
+    slotted = legacy = 0
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen or isinstance(obj, (
+                type, types.ModuleType, types.FunctionType, parsing.Field)):
+            continue
+        seen.add(id(obj))
+        if isinstance(obj, parsing._SubFields):
+            slotted += sys.getsizeof(obj)
+            legacy += dict_size(obj)
+        else:
+            size = sys.getsizeof(obj)
+            slotted += size
+            legacy += size
+        stack.extend(gc.get_referents(obj))
+    return slotted, legacy
+
+
+def main(players=200):
+    packet = PLAY.read_packet(protocol.PacketData(
+        body(player_list_item(players))))
+    for player in packet.players:
+        player.data.properties[0]
+    slotted, legacy = deep_size(packet)
+    print("PlayerListItem with %d players: %d bytes with instance dicts, "
+          "%d bytes slotted (%.0f%%)" % (
+              players, legacy, slotted, slotted / legacy * 100))
+
+
+if __name__ == "__main__":
+    main()
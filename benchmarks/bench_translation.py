@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+# This source file is part of mc4p,
+# the Minecraft Portable Protocol-Parsing Proxy.
+
+# This program is free software. It comes without any warranty, to
+# the extent permitted by applicable law. You can redistribute it
+# and/or modify it under the terms of the Do What The Fuck You Want
+# To Public License, Version 2, as published by Sam Hocevar. See
+# http://www.wtfpl.net/txt/copying/ for more details
+
+"""Translates protocol 47 packets to protocol 109 with the compiled
+translations and by rebuilding them from their fields."""
+
+from __future__ import (
+    division, absolute_import, print_function, unicode_literals)
+
+import timeit
+
+from mc4p import protocol
+from mc4p import translation
+from mc4p.protocols import protocol047
+
+from bench_codecs import body
+
+
+OLD_PLAY = protocol047.protocol.client_bound.play
+
+SAMPLES = (
+    OLD_PLAY.KeepAlive(keep_alive_id=42),
+    OLD_PLAY.ChatMessage(message={"text": "hello"}, position=0),
+    OLD_PLAY.JoinGame(entity_id=1, gamemode=0, dimension=0, difficulty=1,
+                      max_players=20, level_type="default",
+                      reduced_debug_info=False),
+)
+
+
+def rebuild(translator, packet):
+    target = translator.target_packet(packet.__class__)
+    return target(_ignore_extra_fields=True, **dict(
+        (name, getattr(packet, name)) for name in packet._fields))
+
+
+def main(number=20000):
+    translator = translation.Translator.for_versions(47, 109)
+    for sample in SAMPLES:
+        raw = body(sample)
+
+        def compiled():
+            packet = OLD_PLAY.read_packet(protocol.PacketData(raw))
+            translator.translate(packet)._emit()
+
+        def rebuilt():
+            packet = OLD_PLAY.read_packet(protocol.PacketData(raw))
+            rebuild(translator, packet)._emit()
+
+        results = [min(timeit.repeat(f, number=number, repeat=3)) /
+                   number * 1e6 for f in (rebuilt, compiled)]
+        layout = translation.packet_layout(sample.__class__)
+        kind = ("passthrough" if layout is not None and layout ==
+                translation.packet_layout(
+                    translator.target_packet(sample.__class__))
+                else "copy")
+        print("%-12s %-11s  rebuilt: %6.2fus  compiled: %6.2fus" % (
+            sample.__class__.__name__, kind, results[0], results[1]))
+
+
+if __name__ == "__main__":
+    main()
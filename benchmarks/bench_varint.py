@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+# This source file is part of mc4p,
+# the Minecraft Portable Protocol-Parsing Proxy.
+
+# This program is free software. It comes without any warranty, to
+# the extent permitted by applicable law. You can redistribute it
+# and/or modify it under the terms of the Do What The Fuck You Want
+# To Public License, Version 2, as published by Sam Hocevar. See
+# http://www.wtfpl.net/txt/copying/ for more details
+
+"""Compares the VarInt codec against the previous per-byte implementation."""
+
+from __future__ import (
+    division, absolute_import, print_function, unicode_literals)
+
+import struct
+import timeit
+
+from mc4p import parsing
+from mc4p import protocol
+from mc4p import stream
+
+
+VALUES = (0, 0x2e, 300, 16383, 16384, 2097151, 2 ** 31 - 1)
+
+
+def legacy_parse(data):
+    value = 0
+    for i in range(5):
+        b = ord(data.read_bytes(1).tobytes())
+        value |= (b & 0x7F) << 7 * i
+        if not b & 0x80:
+            return value
+    raise IOError("Encountered varint longer than 5 bytes")
+
+
+def legacy_emit(value):
+    return b"".join(
+        struct.pack(
+            b">B",
+            (value >> i * 7) & 0x7f | (value >> (i + 1) * 7 > 0) << 7
+        )
+        for i in range(((value.bit_length() - 1) // 7 + 1) or 1)
+    )
+
+
+def legacy_read_varint(self):
+    value = 0
+    for i in range(5):
+        b = ord(self._read(1)[0])
+        value |= (b & 0x7F) << 7 * i
+        if not b & 0x80:
+            return value
+    raise IOError("Encountered varint longer than 5 bytes")
+
+
+def timed(f, number):
+    return min(timeit.repeat(f, number=number, repeat=3)) / number * 1e9
+
+
+def main(number=100000):
+    input_stream = stream.BufferedPacketInputStream(
+        protocol.Direction.server_bound)
+
+    print("%-12s %12s %12s %12s %12s %12s %12s" % (
+        "value", "parse old", "parse new", "emit old", "emit new",
+        "stream old", "stream new"))
+    for value in VALUES:
+        encoded = parsing.VarInt.emit(value)
+        assert encoded == legacy_emit(value)
+        data = protocol.PacketData(encoded)
+
+        def parse_old():
+            data.read_pos = 0
+            legacy_parse(data)
+
+        def parse_new():
+            data.read_pos = 0
+            parsing.VarInt.parse(data)
+
+        input_stream.buf[:len(encoded)] = encoded
+
+        def stream_old():
+            input_stream.read_pos = 0
+            input_stream.write_pos = len(encoded)
+            legacy_read_varint(input_stream)
+
+        def stream_new():
+            input_stream.read_pos = 0
+            input_stream.write_pos = len(encoded)
+            input_stream._read_varint()
+
+        print("%-12d %10.0fns %10.0fns %10.0fns %10.0fns %10.0fns %10.0fns" % (
+            value,
+            timed(parse_old, number), timed(parse_new, number),
+            timed(lambda: legacy_emit(value), number),
+            timed(lambda: parsing.VarInt.emit(value), number),
+            timed(stream_old, number), timed(stream_new, number)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,412 @@
+# -*- coding: utf-8 -*-
+
+# This source file is part of mc4p,
+# the Minecraft Portable Protocol-Parsing Proxy.
+
+# This program is free software. It comes without any warranty, to
+# the extent permitted by applicable law. You can redistribute it
+# and/or modify it under the terms of the Do What The Fuck You Want
+# To Public License, Version 2, as published by Sam Hocevar. See
+# http://www.wtfpl.net/txt/copying/ for more details
+
+"""
+Decoding and encoding of the block data in ChunkData and MapChunkBulk.
+
+Sections are only decoded when accessed. Block states (``id << 4 | meta``)
+are held in NumPy uint16 arrays if NumPy is installed, in array.array
+otherwise.
+"""
+
+from __future__ import division, absolute_import, unicode_literals
+
+import array
+import struct
+import sys
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from mc4p import parsing
+
+
+SECTIONS = 16
+BLOCKS = 16 * 16 * 16
+LIGHT_SIZE = BLOCKS // 2
+BIOMES_SIZE = 16 * 16
+
+# Bits per block of the global palette used by protocols after 47
+GLOBAL_PALETTE_BITS = 13
+MIN_PALETTE_BITS = 4
+MAX_PALETTE_BITS = 8
+
+_LITTLE_ENDIAN = sys.byteorder == "little"
+_LONG = struct.Struct(b">Q")
+
+
+class ChunkSection(object):
+    """
+    A 16x16x16 section of blocks in YZX order.
+
+    ``palette`` and ``bits_per_block`` are kept from the decoded data so the
+    section can be encoded with the same palette if its blocks still fit.
+    """
+    def __init__(self, blocks, block_light, sky_light=None,
+                 palette=None, bits_per_block=None):
+        self.blocks = blocks
+        self.block_light = block_light
+        self.sky_light = sky_light
+        self.palette = palette
+        self.bits_per_block = bits_per_block
+
+    @classmethod
+    def empty(cls, sky_light=True):
+        return cls(_new_blocks(), bytearray(LIGHT_SIZE),
+                   bytearray(b"\xff" * LIGHT_SIZE) if sky_light else None)
+
+
+def _new_blocks(values=None):
+    if numpy is not None:
+        if values is None:
+            return numpy.zeros(BLOCKS, dtype=numpy.uint16)
+        return numpy.asarray(values, dtype=numpy.uint16)
+    if values is None:
+        return array.array(b"H", [0]) * BLOCKS
+    return array.array(b"H", values)
+
+
+def unpack_indices(data, bits):
+    """Unpacks BLOCKS values of ``bits`` each from big-endian longs"""
+    if numpy is not None:
+        # Little-endian longs form one continuous stream of bits, starting
+        # with the least significant, which values may span freely
+        stream = numpy.frombuffer(data, dtype=">u8").astype("<u8")
+        stream = stream.view(numpy.uint8)
+        shifts = numpy.arange(8, dtype=numpy.uint8)
+        bitstream = (stream[:, None] >> shifts) & 1
+        bitstream = bitstream.ravel()[:BLOCKS * bits].reshape(BLOCKS, bits)
+        weights = 1 << numpy.arange(bits, dtype=numpy.uint32)
+        values = bitstream.astype(numpy.uint32).dot(weights)
+        return values.astype(numpy.uint16)
+
+    longs = [_LONG.unpack_from(data, i)[0] for i in range(0, len(data), 8)]
+    mask = (1 << bits) - 1
+    values = array.array(b"H", [0]) * BLOCKS
+    for i in range(BLOCKS):
+        bit = i * bits
+        index, offset = bit >> 6, bit & 63
+        value = longs[index] >> offset
+        if offset + bits > 64:
+            value |= longs[index + 1] << (64 - offset)
+        values[i] = value & mask
+    return values
+
+
+def pack_indices(values, bits):
+    """Packs BLOCKS values of ``bits`` each into big-endian longs"""
+    if numpy is not None:
+        values = numpy.asarray(values, dtype=numpy.uint32)
+        shifts = numpy.arange(bits, dtype=numpy.uint32)
+        bitstream = (values[:, None] >> shifts) & 1
+        bitstream = bitstream.astype(numpy.uint8).reshape(-1, 8)
+        weights = 1 << numpy.arange(8, dtype=numpy.uint32)
+        stream = bitstream.dot(weights).astype(numpy.uint8)
+        return stream.view("<u8").astype(">u8").tostring()
+
+    longs = [0] * (BLOCKS * bits // 64)
+    for i, value in enumerate(values):
+        bit = i * bits
+        index, offset = bit >> 6, bit & 63
+        longs[index] |= (value << offset) & 0xffffffffffffffff
+        if offset + bits > 64:
+            longs[index + 1] |= value >> (64 - offset)
+    return struct.pack(b">%dQ" % len(longs), *longs)
+
+
+def _states(blocks):
+    """Returns the sorted distinct block states of a section"""
+    if numpy is not None:
+        return numpy.unique(blocks).tolist()
+    return sorted(set(blocks))
+
+
+def _lookup(palette, values):
+    if numpy is not None:
+        return numpy.asarray(palette, dtype=numpy.uint16)[values]
+    return array.array(b"H", (palette[value] for value in values))
+
+
+def _index(palette, blocks):
+    """Maps block states to palette indices, None if one isn't in it"""
+    indices = dict((state, i) for i, state in enumerate(palette))
+    if numpy is not None:
+        states = numpy.unique(blocks)
+        if not all(state in indices for state in states.tolist()):
+            return None
+        table = numpy.zeros(int(states[-1]) + 1, dtype=numpy.uint16)
+        for state in states.tolist():
+            table[state] = indices[state]
+        return table[blocks]
+    try:
+        return array.array(b"H", (indices[state] for state in blocks))
+    except KeyError:
+        return None
+
+
+class _PalettedFormat(object):
+    """Sections of protocols after 47, each stored in one piece"""
+    @staticmethod
+    def scan(data, mask, sky_light):
+        spans = {}
+        position = 0
+        for y in range(SECTIONS):
+            if not mask & 1 << y:
+                continue
+            start = position
+            position += 1
+            palette_length, position = parsing.decode_varint(data, position)
+            for i in range(palette_length):
+                value, position = parsing.decode_varint(data, position)
+            longs, position = parsing.decode_varint(data, position)
+            position += longs * 8 + LIGHT_SIZE * (2 if sky_light else 1)
+            spans[y] = data[start:position]
+        return spans, position
+
+    @staticmethod
+    def decode(data, sky_light):
+        bits = ord(data[0])
+        palette_length, position = parsing.decode_varint(data, 1)
+        palette = []
+        for i in range(palette_length):
+            value, position = parsing.decode_varint(data, position)
+            palette.append(value)
+        longs, position = parsing.decode_varint(data, position)
+        end = position + longs * 8
+        blocks = unpack_indices(data[position:end].tobytes(), bits)
+        if palette:
+            blocks = _lookup(palette, blocks)
+        block_light = bytearray(data[end:end + LIGHT_SIZE].tobytes())
+        sky = None
+        if sky_light:
+            sky = bytearray(data[end + LIGHT_SIZE:
+                                 end + 2 * LIGHT_SIZE].tobytes())
+        return ChunkSection(blocks, block_light, sky, palette or None, bits)
+
+    @staticmethod
+    def encode(section):
+        palette, bits = section.palette, section.bits_per_block
+        indices = None
+        if palette and bits:
+            indices = _index(palette, section.blocks)
+        if indices is None:
+            palette = _states(section.blocks)
+            bits = max(MIN_PALETTE_BITS, (len(palette) - 1).bit_length())
+            if bits > MAX_PALETTE_BITS:
+                palette, bits = [], GLOBAL_PALETTE_BITS
+                indices = section.blocks
+            else:
+                indices = _index(palette, section.blocks)
+        parts = [struct.pack(b">B", bits), parsing.VarInt.emit(len(palette))]
+        parts.extend(parsing.VarInt.emit(state) for state in palette)
+        parts.append(parsing.VarInt.emit(BLOCKS * bits // 64))
+        parts.append(pack_indices(indices, bits))
+        parts.append(bytes(section.block_light))
+        if section.sky_light is not None:
+            parts.append(bytes(section.sky_light))
+        return b"".join(parts)
+
+    @staticmethod
+    def join(parts):
+        return [part for y, part in sorted(parts.iteritems())]
+
+
+class _LegacyFormat(object):
+    """
+    Sections of protocol 47: all blocks as little-endian shorts, followed by
+    all block light and then all sky light
+    """
+    @staticmethod
+    def scan(data, mask, sky_light):
+        ys = [y for y in range(SECTIONS) if mask & 1 << y]
+        light = len(ys) * BLOCKS * 2
+        sky = light + len(ys) * LIGHT_SIZE
+        spans = {}
+        for i, y in enumerate(ys):
+            spans[y] = (
+                data[i * BLOCKS * 2:(i + 1) * BLOCKS * 2],
+                data[light + i * LIGHT_SIZE:light + (i + 1) * LIGHT_SIZE],
+                data[sky + i * LIGHT_SIZE:sky + (i + 1) * LIGHT_SIZE]
+                if sky_light else None,
+            )
+        return spans, sky + (len(ys) * LIGHT_SIZE if sky_light else 0)
+
+    @staticmethod
+    def decode(data, sky_light):
+        blocks, block_light, sky = data
+        if numpy is not None:
+            blocks = numpy.frombuffer(blocks.tobytes(), dtype="<u2")
+            blocks = blocks.astype(numpy.uint16)
+        else:
+            blocks = array.array(b"H", blocks.tobytes())
+            if not _LITTLE_ENDIAN:
+                blocks.byteswap()
+        return ChunkSection(blocks, bytearray(block_light.tobytes()),
+                            bytearray(sky.tobytes()) if sky else None)
+
+    @staticmethod
+    def encode(section):
+        if numpy is not None:
+            blocks = numpy.asarray(section.blocks, dtype="<u2").tostring()
+        else:
+            blocks = array.array(b"H", section.blocks)
+            if not _LITTLE_ENDIAN:
+                blocks.byteswap()
+            blocks = blocks.tostring()
+        sky = section.sky_light
+        return (blocks, bytes(section.block_light),
+                bytes(sky) if sky is not None else None)
+
+    @staticmethod
+    def join(parts):
+        parts = [part for y, part in sorted(parts.iteritems())]
+        return ([blocks for blocks, block_light, sky in parts] +
+                [block_light for blocks, block_light, sky in parts] +
+                [sky for blocks, block_light, sky in parts if sky is not None])
+
+
+class ChunkColumn(object):
+    """
+    The sections of a chunk column, indexed by their y coordinate.
+
+    Sections are decoded on first access. Sections which were never accessed
+    are encoded from their original bytes.
+    """
+    def __init__(self, data, primary_bit_mask, ground_up_continuous=True,
+                 sky_light=None, legacy=False):
+        data = memoryview(data)
+        self.ground_up_continuous = ground_up_continuous
+        self._format = _LegacyFormat if legacy else _PalettedFormat
+        biomes = BIOMES_SIZE if ground_up_continuous else 0
+
+        # Sky light is only sent in the overworld, which the chunk data
+        # doesn't tell, so pick the layout matching the data's length
+        for sky_light in ((sky_light,) if sky_light is not None
+                          else (True, False)):
+            try:
+                spans, end = self._format.scan(data, primary_bit_mask,
+                                               sky_light)
+            except (IndexError, IOError):
+                continue
+            if end + biomes == len(data):
+                break
+        else:
+            raise IOError("Chunk data doesn't match its primary bit mask")
+
+        self.sky_light = sky_light
+        self._raw = spans
+        self._sections = {}
+        self.biomes = (bytearray(data[end:end + biomes].tobytes())
+                       if ground_up_continuous else None)
+
+    @property
+    def primary_bit_mask(self):
+        mask = 0
+        for y in self:
+            mask |= 1 << y
+        return mask
+
+    def __iter__(self):
+        return iter(sorted(set(self._raw) | set(self._sections)))
+
+    def __contains__(self, y):
+        return y in self._raw or y in self._sections
+
+    def __getitem__(self, y):
+        try:
+            return self._sections[y]
+        except KeyError:
+            section = self._format.decode(self._raw.pop(y), self.sky_light)
+            self._sections[y] = section
+            return section
+
+    def __setitem__(self, y, section):
+        self._raw.pop(y, None)
+        self._sections[y] = section
+
+    def __delitem__(self, y):
+        if self._raw.pop(y, None) is None:
+            del self._sections[y]
+
+    def encode(self):
+        parts = dict(self._raw)
+        for y, section in self._sections.iteritems():
+            parts[y] = self._format.encode(section)
+        parts = self._format.join(parts)
+        if self.biomes is not None:
+            parts.append(bytes(self.biomes))
+        return b"".join(
+            part.tobytes() if isinstance(part, memoryview) else part
+            for part in parts
+        )
+
+
+# Protocol using the format of _LegacyFormat, older ones aren't supported
+LEGACY_VERSION = 47
+
+
+def _is_legacy(packet):
+    version = packet._context.protocol.version
+    if version < LEGACY_VERSION:
+        raise ValueError("Chunk data of protocol %d isn't supported" %
+                         version)
+    return version == LEGACY_VERSION
+
+
+def decode_chunk_data(packet, sky_light=None):
+    """Returns the ChunkColumn of a ChunkData packet"""
+    return ChunkColumn(packet.data, packet.primary_bit_mask,
+                       packet.ground_up_continous, sky_light,
+                       legacy=_is_legacy(packet))
+
+
+def encode_chunk_data(packet, column):
+    """Stores a ChunkColumn in a ChunkData packet"""
+    packet.primary_bit_mask = column.primary_bit_mask
+    packet.ground_up_continous = column.ground_up_continuous
+    packet.data = column.encode()
+
+
+_BULK_HEADER = struct.Struct(b">?")
+_BULK_META = struct.Struct(b">iiH")
+
+
+def decode_map_chunk_bulk(packet):
+    """Returns ``(chunk_x, chunk_z, column)`` tuples of a MapChunkBulk"""
+    data = memoryview(packet.data)
+    sky_light = _BULK_HEADER.unpack_from(data)[0]
+    count, position = parsing.decode_varint(data, _BULK_HEADER.size)
+    meta = []
+    for i in range(count):
+        meta.append(_BULK_META.unpack_from(data, position))
+        position += _BULK_META.size
+
+    section_size = BLOCKS * 2 + LIGHT_SIZE * (2 if sky_light else 1)
+    columns = []
+    for chunk_x, chunk_z, mask in meta:
+        size = bin(mask).count("1") * section_size + BIOMES_SIZE
+        columns.append((chunk_x, chunk_z, ChunkColumn(
+            data[position:position + size], mask, True, sky_light,
+            legacy=True)))
+        position += size
+    return columns
+
+
+def encode_map_chunk_bulk(packet, columns):
+    """Stores ``(chunk_x, chunk_z, column)`` tuples in a MapChunkBulk"""
+    sky_light = any(column.sky_light for x, z, column in columns)
+    parts = [_BULK_HEADER.pack(sky_light), parsing.VarInt.emit(len(columns))]
+    parts.extend(_BULK_META.pack(x, z, column.primary_bit_mask)
+                 for x, z, column in columns)
+    parts.extend(column.encode() for x, z, column in columns)
+    packet.data = b"".join(parts)
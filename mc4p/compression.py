@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+
+# This source file is part of mc4p,
+# the Minecraft Portable Protocol-Parsing Proxy.
+
+# This program is free software. It comes without any warranty, to
+# the extent permitted by applicable law. You can redistribute it
+# and/or modify it under the terms of the Do What The Fuck You Want
+# To Public License, Version 2, as published by Sam Hocevar. See
+# http://www.wtfpl.net/txt/copying/ for more details
+
+"""zlib compressors used for packets above the compression threshold."""
+
+from __future__ import absolute_import, division, unicode_literals
+
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import zlib
+
+try:
+    import queue
+except ImportError:  # PY2
+    import Queue as queue
+
+# CPU time of the current thread where available. Python 2 has no such
+# clock, and its time.clock counts every thread of the process, so the wall
+# time around the zlib call is used instead.
+_cpu_time = getattr(time, "thread_time", None) or time.time
+
+# zlib strategies by the names of their Z_* constants, Python 2's zlib
+# module lacks the last two
+STRATEGIES = {
+    "default": zlib.Z_DEFAULT_STRATEGY,
+    "filtered": zlib.Z_FILTERED,
+    "huffman-only": zlib.Z_HUFFMAN_ONLY,
+    "rle": getattr(zlib, "Z_RLE", 3),
+    "fixed": getattr(zlib, "Z_FIXED", 4),
+}
+
+
+def _compressobj(level, strategy):
+    return zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS,
+                            zlib.DEF_MEM_LEVEL, strategy)
+
+
+class Compressor(object):
+    """
+    Compresses packets at a fixed zlib level and strategy.
+
+    Every packet is compressed by a copy of an initialized compression
+    object instead of setting up a new one.
+    """
+    def __init__(self, level=zlib.Z_DEFAULT_COMPRESSION,
+                 strategy=zlib.Z_DEFAULT_STRATEGY):
+        self.level = level
+        self.strategy = strategy
+        self._template = _compressobj(level, strategy)
+
+    def _compress(self, template, segments):
+        compressor = template.copy()
+        parts = [
+            compressor.compress(segment.tobytes()
+                                if isinstance(segment, memoryview)
+                                else segment)
+            for segment in segments
+        ]
+        parts.append(compressor.flush())
+        return b"".join(parts)
+
+    def compress(self, segments):
+        """Compresses a list of buffers into a single zlib stream"""
+        return self._compress(self._template, segments)
+
+    def __repr__(self):
+        return "<%s level:%d strategy:%d>" % (
+            self.__class__.__name__, self.level, self.strategy)
+
+
+class AdaptiveCompressor(Compressor):
+    """
+    Adjusts the compression level to the CPU time it takes.
+
+    The level is lowered while compressing a byte takes more than budget
+    seconds of CPU time on average, and raised again once it takes less than
+    half of that. The time is measured on a per-thread CPU clock where
+    Python has one (3.7 and later), and as the wall time around the zlib
+    call otherwise, which also counts time the thread spent preempted.
+
+    Each instance keeps its own average, so give every stream, or at least
+    every direction, its own compressor.
+    """
+    def __init__(self, budget=20e-9, min_level=1, max_level=6,
+                 strategy=zlib.Z_DEFAULT_STRATEGY, smoothing=0.1):
+        self.budget = budget
+        self.min_level = min_level
+        self.max_level = max_level
+        self.strategy = strategy
+        self.smoothing = smoothing
+        self._templates = dict(
+            (level, _compressobj(level, strategy))
+            for level in range(min_level, max_level + 1)
+        )
+        self.level = max_level
+        # Moving average of the CPU time per byte at the current level
+        self.cost = None
+
+    def compress(self, segments):
+        level = self.level
+        start = _cpu_time()
+        data = self._compress(self._templates[level], segments)
+        elapsed = _cpu_time() - start
+
+        length = sum(len(segment) for segment in segments)
+        if length:
+            self._update(level, elapsed / length)
+        return data
+
+    def _update(self, level, cost):
+        if level != self.level:
+            # Another thread changed the level in the meantime
+            return
+        if self.cost is None:
+            self.cost = cost
+        else:
+            self.cost += self.smoothing * (cost - self.cost)
+
+        if self.cost > self.budget and level > self.min_level:
+            self.level = level - 1
+            self.cost = None
+        elif self.cost < self.budget / 2 and level < self.max_level:
+            self.level = level + 1
+            self.cost = None
+
+
+DEFAULT_COMPRESSOR = Compressor()
+
+
+class Job(object):
+    """A function call queued on a WorkerPool"""
+    def __init__(self, function, args):
+        self._function = function
+        self._args = args
+        self._result = None
+        self._error = None
+        self._done = threading.Event()
+
+    def run(self):
+        try:
+            self._result = self._function(*self._args)
+        except Exception:
+            self._error = sys.exc_info()
+        finally:
+            self._function = self._args = None
+            self._done.set()
+
+    def result(self):
+        """Waits for the call to finish and returns its result"""
+        self._done.wait()
+        if self._error is not None:
+            raise self._error[0], self._error[1], self._error[2]
+        return self._result
+
+
+class WorkerPool(object):
+    """
+    Threads compressing and inflating packets of at least cutoff bytes.
+
+    zlib releases the GIL, so large packets are processed in parallel while
+    the endpoint threads go on with smaller ones. The streams using the pool
+    wait for the jobs in the order they submitted them, so packets are never
+    reordered. The threads are started on first use, which makes a pool
+    created before the server forks usable in each connection's process.
+    """
+    def __init__(self, workers=None, cutoff=1 << 16):
+        self.workers = workers or multiprocessing.cpu_count()
+        self.cutoff = cutoff
+        self._queue = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._work,
+                                          args=(self._queue,),
+                                          name="zlib-worker-%d" % i)
+                thread.daemon = True
+                thread.start()
+            self._pid = os.getpid()
+
+    @staticmethod
+    def _work(jobs):
+        while True:
+            jobs.get().run()
+
+    def submit(self, function, *args):
+        """Calls function with args on a worker thread and returns a Job"""
+        if self._pid != os.getpid():
+            self._start()
+        job = Job(function, args)
+        self._queue.put(job)
+        return job
+
+    def __repr__(self):
+        return "<%s workers:%d cutoff:%d>" % (
+            self.__class__.__name__, self.workers, self.cutoff)
@@ -11,10 +11,23 @@
 
 from __future__ import absolute_import, print_function, unicode_literals
 
+import collections
+import warnings
+
 from Crypto.PublicKey import RSA
 from Crypto import Random
 from Crypto.Cipher import AES, PKCS1_v1_5
 
+try:
+    with warnings.catch_warnings():
+        # Recent versions warn about being imported on Python 2
+        warnings.simplefilter("ignore")
+        from cryptography.hazmat.backends import default_backend
+        from cryptography.hazmat.primitives.ciphers import (
+            Cipher, algorithms, modes)
+except ImportError:
+    Cipher = None
+
 
 def decode_public_key(bytes):
     """Decodes a public RSA key in ASN.1 format as defined by x.509"""
@@ -57,12 +70,140 @@ def decrypt_shared_secret(encrypted_key, private_key):
     return cipher.decrypt(encrypted_key, generate_shared_secret())
 
 
-def AES128CFB8(shared_secret):
-    """Creates a AES128 stream cipher using cfb8 mode"""
-    return AES.new(shared_secret, AES.MODE_CFB, shared_secret)
+# Bytes output buffers need past the data written into them for every
+# backend to write there directly. cryptography's update_into wants room for
+# another block, even though cfb8 never uses it.
+OUTPUT_SLACK = 15
+
+
+def _to_bytes(data):
+    # pycrypto only takes strings and read-only buffers
+    if isinstance(data, memoryview):
+        return data.tobytes()
+    return bytes(data)
+
+
+class PyCryptoCipher(object):
+    """
+    AES128 in cfb8 mode as implemented by pycrypto, or pycryptodome which
+    can also write into existing buffers.
+
+    Like all ciphers, an instance is either used to encrypt or to decrypt.
+    The _into methods write len(data) bytes to the start of out, which may
+    be the memory data is in.
+    """
+    def __init__(self, shared_secret):
+        self._cipher = AES.new(shared_secret, AES.MODE_CFB, shared_secret)
+
+    def encrypt(self, data):
+        return self._cipher.encrypt(_to_bytes(data))
+
+    def decrypt(self, data):
+        return self._cipher.decrypt(_to_bytes(data))
+
+    def encrypt_into(self, data, out):
+        out[:len(data)] = self._cipher.encrypt(_to_bytes(data))
+
+    def decrypt_into(self, data, out):
+        out[:len(data)] = self._cipher.decrypt(_to_bytes(data))
+
+
+class PyCryptodomeCipher(PyCryptoCipher):
+    def encrypt_into(self, data, out):
+        self._cipher.encrypt(data, output=out[:len(data)])
+
+    def decrypt_into(self, data, out):
+        self._cipher.decrypt(data, output=out[:len(data)])
+
+
+class CryptographyCipher(object):
+    """AES128 in cfb8 mode as implemented by cryptography's OpenSSL backend"""
+
+    def __init__(self, shared_secret):
+        cipher = Cipher(algorithms.AES(shared_secret),
+                        modes.CFB8(shared_secret), default_backend())
+        self._encryptor = cipher.encryptor()
+        self._decryptor = cipher.decryptor()
+
+    def encrypt(self, data):
+        return self._encryptor.update(data)
+
+    def decrypt(self, data):
+        return self._decryptor.update(data)
+
+    def encrypt_into(self, data, out):
+        if len(out) >= len(data) + OUTPUT_SLACK:
+            self._encryptor.update_into(data, out)
+        else:
+            out[:len(data)] = self._encryptor.update(data)
+
+    def decrypt_into(self, data, out):
+        if len(out) >= len(data) + OUTPUT_SLACK:
+            self._decryptor.update_into(data, out)
+        else:
+            out[:len(data)] = self._decryptor.update(data)
+
+
+def _supports_output():
+    cipher = AES.new(b"\0" * 16, AES.MODE_CFB, b"\0" * 16)
+    try:
+        cipher.encrypt(b"\0", output=bytearray(1))
+    except TypeError:
+        return False
+    return True
+
+
+# Available cipher backends by name, the fastest one first
+CIPHER_BACKENDS = collections.OrderedDict()
+if Cipher is not None:
+    CIPHER_BACKENDS["cryptography"] = CryptographyCipher
+if _supports_output():
+    CIPHER_BACKENDS["pycryptodome"] = PyCryptodomeCipher
+CIPHER_BACKENDS["pycrypto"] = PyCryptoCipher
+
+
+def AES128CFB8(shared_secret, backend=None):
+    """
+    Creates a AES128 stream cipher using cfb8 mode, with the named backend
+    or the fastest one available
+    """
+    if backend is None:
+        backend = next(iter(CIPHER_BACKENDS))
+    return CIPHER_BACKENDS[backend](shared_secret)
+
+
+def check_cipher_backends():
+    """
+    Encrypts and decrypts memoryviews, bytearrays and strings with every
+    available backend, in place and not, checking them against each other.
+    """
+    shared_secret = generate_shared_secret()
+    plaintext = generate_random_bytes(1000)
+    expected = None
+    for name in CIPHER_BACKENDS:
+        encryptor = AES128CFB8(shared_secret, name)
+        buf = bytearray(plaintext) + bytearray(OUTPUT_SLACK)
+        view = memoryview(buf)
+        ciphertext = encryptor.encrypt(view[:10])
+        ciphertext += encryptor.encrypt(bytearray(plaintext[10:20]))
+        ciphertext += encryptor.encrypt(plaintext[20:100])
+        encryptor.encrypt_into(view[100:len(plaintext)], view[100:])
+        ciphertext += bytes(buf[100:len(plaintext)])
+        if expected is None:
+            expected = ciphertext
+        assert ciphertext == expected, "%s encrypts differently" % name
+
+        decryptor = AES128CFB8(shared_secret, name)
+        buf = bytearray(ciphertext)
+        view = memoryview(buf)
+        decryptor.decrypt_into(view[:500], view)
+        assert decryptor.decrypt(view[500:]) == plaintext[500:], name
+        assert bytes(buf[:500]) == plaintext[:500], name
+    print("Cipher backends agree: %s" % ", ".join(CIPHER_BACKENDS))
 
 
 if __name__ == "__main__":
+    check_cipher_backends()
     pair = generate_key_pair()
     nonce = generate_challenge_token()
     encrypted = encrypt_shared_secret(nonce, pair)
@@ -65,6 +65,9 @@ class _MetaEndpoint(type):
 class Endpoint(threading.Thread):
     __metaclass__ = _MetaEndpoint
 
+    # Read packets without any handlers as stream.RawFrame objects
+    forward_raw_frames = False
+
     def __init__(self, sock, incoming_direction, version=0):
         super(Endpoint, self).__init__()
         self.sock = sock
@@ -90,6 +93,10 @@ class Endpoint(threading.Thread):
             k: [getattr(self.__class__, f) for f in v]
             for k, v in self.class_packet_handlers.iteritems()
         }
+        # Per context dispatch tables, see _dispatch_table
+        self._dispatch_tables = {}
+        if self.forward_raw_frames:
+            self.input_stream.interesting_ids = self._interesting_ids
 
         self._send_lock = threading.Lock()
 
@@ -131,14 +138,44 @@ class Endpoint(threading.Thread):
         return False
 
     def _call_packet_handlers(self, packet):
-        key = _packet_handler_key(packet)
-        handlers = self.instance_packet_handlers.get(key)
-        if handlers:
-            # handlers might unregister themselves, so we need to copy the list
-            for handler in tuple(handlers):
+        context = packet._context
+        if context is None:
+            return
+        handlers = self._dispatch_table(context)[1]
+        id_ = packet.id
+        if 0 <= id_ < len(handlers) and handlers[id_]:
+            # The tuples are replaced, not modified, if handlers unregister
+            # themselves
+            for handler in handlers[id_]:
                 if handler(self, packet):
                     return True
 
+    def _dispatch_table(self, context):
+        """
+        Returns the context's dispatch table, a tuple of handlers indexed by
+        packet id and the ids of all packets with any handlers. It's rebuilt
+        once either side's handlers change.
+        """
+        cached = self._dispatch_tables.get(context)
+        if cached is not None and cached[0] is context.dispatch_table:
+            return cached
+
+        handlers = [()] * len(context.dispatch_table)
+        ids = set(context.handled_ids)
+        for id_, entry in enumerate(context.dispatch_table):
+            if entry is None:
+                continue
+            key = _packet_handler_key(entry[0])
+            if self.instance_packet_handlers.get(key):
+                handlers[id_] = tuple(self.instance_packet_handlers[key])
+                ids.add(id_)
+        cached = (context.dispatch_table, handlers, frozenset(ids))
+        self._dispatch_tables[context] = cached
+        return cached
+
+    def _interesting_ids(self, context):
+        return self._dispatch_table(context)[2]
+
     def _instance_packet_handler(self, packet):
         def packet_handler_wrapper(f):
             self.register_packet_handler(packet, f)
@@ -148,14 +185,38 @@ class Endpoint(threading.Thread):
     def register_packet_handler(self, packet, f):
         key = _packet_handler_key(packet)
         self.instance_packet_handlers.setdefault(key, []).append(f)
+        self._dispatch_tables.clear()
 
     def unregister_packet_handler(self, packet, f):
         key = _packet_handler_key(packet)
         self.instance_packet_handlers[key].remove(f)
+        self._dispatch_tables.clear()
 
     def handle_packet_error(self, error):
         return False
 
+    def handle_packets_read(self):
+        """
+        Called after all packets received at once were handled, before the
+        data they were read from is overwritten.
+        """
+        pass
+
+    def throttle(self):
+        """
+        Called before every recv, blocking stops reading from the socket
+        for a while.
+        """
+        pass
+
+    def wait_for_room(self):
+        """
+        Blocks while the output backlog is too large, see
+        BufferedPacketOutputStream.wait_for_room, or until disconnected.
+        """
+        while self.connected and not self.output_stream.wait_for_room(1):
+            pass
+
     def close(self, reason=None):
         if self.connected:
             if self._disconnect_reason is None:
@@ -172,6 +233,7 @@ class Endpoint(threading.Thread):
                 self.flush()
             except Exception:
                 pass
+            self.output_stream.close()
 
             self.sock.close()
             self._handle_disconnect()
@@ -208,6 +270,7 @@ class Endpoint(threading.Thread):
 
     def recv(self):
         while True:
+            self.throttle()
             read_bytes = self.input_stream.recv_from(self.sock)
             if not read_bytes:
                 raise EOFError()
@@ -221,12 +284,17 @@ class Endpoint(threading.Thread):
                         'Exception occured while handling packet %s' % packet)
                     if not self.handle_packet_error(e):
                         raise
+            self.handle_packets_read()
             if not select.select([self.sock], [], [], 0)[0]:
                 break
 
     def flush(self):
         self.output_stream.flush(self.sock)
 
+    def schedule_flush(self):
+        """Flushes after the output stream's flush_delay"""
+        self.output_stream.schedule_flush(self.sock)
+
     def debug_send_packet(self, packet):
         pass
 
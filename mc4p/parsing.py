@@ -11,10 +11,13 @@
 
 from __future__ import division, absolute_import, unicode_literals
 
+import array
 import collections
 import json
 import logging
+import operator
 import struct
+import sys
 import uuid
 
 from mc4p import util
@@ -23,9 +26,177 @@ from mc4p import util
 logger = logging.getLogger("parsing")
 
 
+def _field_runs(fields):
+    """
+    Groups consecutive fixed-width fields into runs.
+
+    Yields ``(struct, items)`` tuples, where ``struct`` is a precompiled
+    ``struct.Struct`` covering every field of the run, or None for a single
+    field of variable width.
+    """
+    run = []
+    for name, field in fields.iteritems():
+        if field._struct_format is not None:
+            run.append((name, field))
+            continue
+        if run:
+            yield _run_struct(run), run
+            run = []
+        yield None, [(name, field)]
+    if run:
+        yield _run_struct(run), run
+
+
+def _run_struct(run):
+    return struct.Struct(
+        b">" + b"".join(field._struct_format for name, field in run))
+
+
+def compile_parser(fields, cls=None, offsets=False, storage=None):
+    """
+    Generates a function parsing all ``fields`` in one straight-line call.
+
+    The returned function takes ``(data, parent, values)`` and stores every
+    parsed value in the ``values`` mapping under the field's name, or in the
+    slots of ``values`` if the slotted class ``cls`` is given. ``storage``
+    optionally maps field names to the slots holding them. Runs of
+    fixed-width fields are decoded with a single ``struct.unpack_from``.
+
+    If ``offsets`` is set, the function returns the read positions before
+    the first and after every unit of ``field_units(fields)``.
+    """
+    storage = storage or {}
+    namespace = {}
+    lines = ["def parse(data, parent, values):"]
+    if offsets:
+        lines.append("    offsets = [data.read_pos]")
+
+    def store(name, expr):
+        if cls is None:
+            lines.append("    values[%r] = %s" % (name, expr))
+        else:
+            setter = str("_set_%s" % name)
+            namespace[setter] = cls.__dict__[storage.get(name, name)].__set__
+            lines.append("    %s(values, %s)" % (setter, expr))
+
+    for i, (struct_, run) in enumerate(_field_runs(fields)):
+        if struct_ is None:
+            name, field = run[0]
+            namespace[str("_parse_%d" % i)] = field.parse
+            store(name, "_parse_%d(data, parent)" % i)
+        elif cls is None:
+            namespace[str("_struct_%d" % i)] = struct_
+            lines.append("    (%s,) = data.unpack(_struct_%d)" % (
+                ", ".join("values[%r]" % name for name, field in run), i))
+        else:
+            namespace[str("_struct_%d" % i)] = struct_
+            lines.append("    run = data.unpack(_struct_%d)" % i)
+            for j, (name, field) in enumerate(run):
+                store(name, "run[%d]" % j)
+        if offsets:
+            lines.append("    offsets.append(data.read_pos)")
+    lines.append("    return offsets" if offsets else "    return values")
+    return _compile_function("parse", lines, namespace)
+
+
+def compile_emitter(fields, attributes=False, storage=None):
+    """
+    Generates a function emitting all ``fields`` in one straight-line call.
+
+    The returned function takes ``(values, parent)`` and returns a tuple of
+    the emitted parts, ready to be passed to ``util.combine_memoryview``.
+    Values are looked up as items of ``values``, or as its attributes if
+    ``attributes`` is set. ``storage`` optionally maps field names to the
+    attributes holding them. Runs of fixed-width fields are encoded with a
+    single ``struct.pack``.
+    """
+    storage = storage or {}
+
+    def lookup(name):
+        name = storage.get(name, name)
+        return ("values.%s" if attributes else "values[%r]") % name
+
+    namespace = {}
+    parts = []
+    for i, (struct_, run) in enumerate(_field_runs(fields)):
+        if struct_ is None:
+            name, field = run[0]
+            namespace[str("_emit_%d" % i)] = field.emit
+            parts.append("_emit_%d(%s, parent)," % (i, lookup(name)))
+        else:
+            namespace[str("_pack_%d" % i)] = struct_.pack
+            parts.append("_pack_%d(%s)," % (
+                i, ", ".join(lookup(name) for name, field in run)))
+    lines = ["def emit(values, parent):",
+             "    return (%s)" % " ".join(parts)]
+    return _compile_function("emit", lines, namespace)
+
+
+def field_units(fields, attributes=False, storage=None):
+    """
+    Splits ``fields`` into the units the compiled codecs work with.
+
+    Returns a list of ``(names, emit)`` tuples, one for every fixed-width
+    run or other field, where ``emit(values, parent)`` encodes just that unit
+    from ``values``, which is accessed like in ``compile_emitter``. The parts
+    of ``compile_emitter`` and the offsets of ``compile_parser`` follow the
+    same units.
+    """
+    storage = storage or {}
+    getter = operator.attrgetter if attributes else operator.itemgetter
+    units = []
+    for struct_, run in _field_runs(fields):
+        names = tuple(name for name, field in run)
+        get = getter(*[str(storage.get(name, name)) for name in names])
+        if struct_ is None:
+            emit = (lambda get, emit: lambda values, parent:
+                    emit(get(values), parent))(get, run[0][1].emit)
+        elif len(names) == 1:
+            emit = (lambda get, pack: lambda values, parent:
+                    pack(get(values)))(get, struct_.pack)
+        else:
+            emit = (lambda get, pack: lambda values, parent:
+                    pack(*get(values)))(get, struct_.pack)
+        units.append((names, emit))
+    return units
+
+
+def _compile_function(name, lines, namespace):
+    code = compile("\n".join(lines) + "\n", "<mc4p codec>", "exec",
+                   0, True)
+    exec(code, namespace)
+    return namespace[name]
+
+
+class SkippedValueError(Exception):
+    pass
+
+
+class _Skipped(object):
+    """Stands in for the value of a field which was skipped undecoded"""
+    __slots__ = ()
+
+    def _read(self, *args):
+        raise SkippedValueError(
+            "A condition read a field which was skipped without decoding it")
+
+    __nonzero__ = __bool__ = __eq__ = __ne__ = __hash__ = __len__ = _read
+    __lt__ = __le__ = __gt__ = __ge__ = _read
+
+    def __repr__(self):
+        return "SKIPPED"
+
+
+SKIPPED = _Skipped()
+
+
 class Field(object):
     _NEXT_ID = 1
 
+    # struct format character of fixed-width fields, used to fuse runs of
+    # them into a single struct.Struct
+    _struct_format = None
+
     def __init__(self):
         self._order_id = Field._NEXT_ID
         Field._NEXT_ID += 1
@@ -34,6 +205,18 @@ class Field(object):
     def parse(cls, data, parent):
         return None
 
+    def skip(self, data, parent=None):
+        """
+        Advances data past this field without building its value.
+
+        Returns the value if it is as cheap to decode as to skip, SKIPPED
+        otherwise. Conditions of Switch and Optional fields are evaluated on
+        these values while skipping, so they may only read numbers, Data and
+        the fields of SubFields; reading a string, JSON, UUID or array
+        raises SkippedValueError instead of taking the wrong branch.
+        """
+        return self.parse(data, parent)
+
     @classmethod
     def prepare(cls, data, parent):
         """Used to set stray length fields"""
@@ -46,6 +229,13 @@ class Field(object):
     def format(self, value):
         return str(value)
 
+    def signature(self):
+        """
+        Returns a hashable description of the wire format, equal for fields
+        encoding the same values the same way, or None if it can't be told.
+        """
+        return (self.__class__.__name__,)
+
     def __str__(self):
         return self.__class__.__name__
 
@@ -65,17 +255,18 @@ class Empty(Field):
 
 
 def simple_type_field(name, format):
-    format = b">" + format
-    length = struct.calcsize(format)
+    struct_ = struct.Struct(b">" + format)
 
     class SimpleType(Field):
+        _struct_format = format
+
         @classmethod
         def parse(cls, data, parent=None):
-            return struct.unpack(format, data.read_bytes(length))[0]
+            return data.unpack(struct_)[0]
 
         @classmethod
         def emit(cls, value, parent=None):
-            return struct.pack(format, value)
+            return struct_.pack(value)
 
     SimpleType.__name__ = name
     return SimpleType
@@ -95,65 +286,172 @@ UnsignedLong = simple_type_field(b"UnsignedLong", b"Q")
 
 
 class Bool(Field):
+    _struct_format = b"?"
+    _struct = struct.Struct(b">?")
+
     @classmethod
     def parse(cls, data, parent=None):
-        return struct.unpack(b"b", data.read_bytes(1))[0] != 0
+        return data.unpack(cls._struct)[0]
 
     @classmethod
     def emit(cls, value, parent=None):
-        return struct.pack(b"b", 1 if value else 0)
+        return cls._struct.pack(value)
+
+
+def decode_varint(buf, offset=0):
+    """
+    Decodes a VarInt from ``buf`` starting at ``offset``.
+
+    Returns a ``(value, offset)`` tuple with the offset just past the VarInt.
+    Raises IndexError if the buffer ends in the middle of the VarInt.
+    """
+    # ord() is about 3x as fast as struct.unpack() for single bytes
+    b = ord(buf[offset])
+    if not b & 0x80:
+        return b, offset + 1
+    value = b & 0x7F
+    for i in range(1, 5):
+        b = ord(buf[offset + i])
+        value |= (b & 0x7F) << 7 * i
+        if not b & 0x80:
+            return value, offset + i + 1
+    raise IOError("Encountered varint longer than 5 bytes")
+
+
+def encode_varint(value):
+    """Encodes a VarInt, negative values as 32 bit two's complement"""
+    if value < 0:
+        value += 1 << 32
+    out = bytearray()
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+# Packet ids, string and array lengths are almost always below 2^14
+_VARINT_CACHE_SIZE = 1 << 14
+_VARINT_CACHE = tuple(encode_varint(i) for i in range(_VARINT_CACHE_SIZE))
 
 
 class VarInt(Field):
     @classmethod
     def parse(cls, data, parent=None):
-        value = 0
-        for i in range(5):
-            # ord() is about 3x as fast as struct.unpack() for single bytes
-            b = ord(data.read_bytes(1).tobytes())
-            value |= (b & 0x7F) << 7 * i
-            if not b & 0x80:
-                return value
-        raise IOError("Encountered varint longer than 5 bytes")
+        return data.read_varint()
 
     @classmethod
     def emit(cls, value, parent=None):
-        return b"".join(
-            struct.pack(
-                b">B",
-                (value >> i * 7) & 0x7f | (value >> (i + 1) * 7 > 0) << 7
-            )
-            for i in range(((value.bit_length() - 1) // 7 + 1) or 1)
-        )
+        if 0 <= value < _VARINT_CACHE_SIZE:
+            return _VARINT_CACHE[value]
+        return encode_varint(value)
+
+
+def _decode_string(raw):
+    # Most strings are ASCII, which decodes about twice as fast
+    try:
+        return raw.decode("ascii")
+    except UnicodeDecodeError:
+        return raw.decode("utf-8")
 
 
 class String(Field):
+    INTERN_SIZE = 1024
+
+    def __init__(self, intern=False):
+        """
+        Interned strings share decoded values and cache their encoding, for
+        fields repeating a small set of identifiers.
+        """
+        super(String, self).__init__()
+        if intern:
+            self._decoded = util.BoundedCache(self.INTERN_SIZE)
+            self._encoded = util.BoundedCache(self.INTERN_SIZE)
+            self.parse = self._parse_interned
+            self.emit = self._emit_interned
+
     @classmethod
     def parse(cls, data, parent=None):
-        return unicode(data.read_bytes(VarInt.parse(data)).tobytes(),
-                       encoding="utf-8")
+        return _decode_string(data.read_bytes(data.read_varint()).tobytes())
+
+    def _parse_interned(self, data, parent=None):
+        raw = data.read_bytes(data.read_varint()).tobytes()
+        try:
+            return self._decoded[raw]
+        except KeyError:
+            value = self._decoded[raw] = _decode_string(raw)
+            return value
+
+    @classmethod
+    def skip(cls, data, parent=None):
+        data.skip(data.read_varint())
+        return SKIPPED
 
     @classmethod
     def emit(cls, value, parent=None):
-        return VarInt.emit(len(value)) + value.encode("utf-8")
+        try:
+            raw = value.encode("ascii")
+        except UnicodeEncodeError:
+            raw = value.encode("utf-8")
+        return VarInt.emit(len(raw)) + raw
+
+    def _emit_interned(self, value, parent=None):
+        try:
+            return self._encoded[value]
+        except KeyError:
+            raw = self._encoded[value] = String.emit(value, parent)
+            return raw
 
     def format(self, value):
         return value
 
 
+class LazyJson(object):
+    """
+    Undecoded JSON value as parsed by Json fields.
+
+    Packets and SubFields decode it when the field is first accessed. Until
+    then, emitting the field reuses the original bytes.
+    """
+    __slots__ = ("raw",)
+
+    def __init__(self, raw):
+        self.raw = raw
+
+    def decode(self):
+        return json.loads(self.raw)
+
+    def __repr__(self):
+        return "<LazyJson: %s>" % self.raw.decode("utf-8")
+
+
 class Json(Field):
     @classmethod
     def parse(cls, data, parent=None):
-        return json.loads(String.parse(data, parent))
+        return LazyJson(data.read_bytes(data.read_varint()).tobytes())
+
+    @classmethod
+    def skip(cls, data, parent=None):
+        return String.skip(data, parent)
 
     @classmethod
     def emit(cls, value, parent=None):
+        if isinstance(value, LazyJson):
+            return VarInt.emit(len(value.raw)) + value.raw
         return String.emit(json.dumps(value), parent)
 
+    @classmethod
+    def format(cls, value):
+        if isinstance(value, LazyJson):
+            return value.raw.decode("utf-8")
+        return str(value)
+
 
 class Chat(Json):
     @classmethod
     def format(cls, value):
+        if isinstance(value, LazyJson):
+            return util.parse_chat_json(value.raw)
         return util.parse_chat(value)
 
     @classmethod
@@ -168,6 +466,11 @@ class UUID(Field):
     def parse(cls, data, parent=None):
         return uuid.UUID(bytes=data.read_bytes(16).tobytes())
 
+    @classmethod
+    def skip(cls, data, parent=None):
+        data.skip(16)
+        return SKIPPED
+
     @classmethod
     def emit(cls, value, parent=None):
         return value.bytes
@@ -219,6 +522,10 @@ class Data(Field):
             length = self._size.parse(data, parent)
         return data.read_bytes(length)
 
+    def skip(self, data, parent=None):
+        # Views are as cheap as skipping
+        return self.parse(data, parent)
+
     def emit(self, value, parent=None):
         if self._size is None:
             return value
@@ -228,6 +535,12 @@ class Data(Field):
                 value
             )
 
+    def signature(self):
+        if self._size is None:
+            return ("Data", None)
+        size = self._size.signature()
+        return ("Data", size) if size is not None else None
+
     def format(self, value):
         if value is None:
             return "None"
@@ -242,6 +555,9 @@ class Data(Field):
 
 
 class _SubStructure(object):
+    # Empty so slotted subclasses don't get an instance dict
+    __slots__ = ()
+
     def __init__(self, parent, type):
         self._parent = parent
         self._type = type
@@ -250,9 +566,9 @@ class _SubStructure(object):
     def _ready(self):
         self._is_ready = True
 
-    def _make_dirty(self):
+    def _make_dirty(self, child=None):
         if self._parent is not None and self._is_ready:
-            self._parent._make_dirty()
+            self._parent._make_dirty(self)
 
     def __setattr__(self, attr, value):
         super(_SubStructure, self).__setattr__(attr, value)
@@ -271,26 +587,216 @@ class _Array(_SubStructure, list):
         self._size = size
 
 
+class _Unparsed(object):
+    """Raw bytes of an array element which hasn't been decoded yet"""
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = data
+
+
+class _LazyArray(_SubStructure, collections.MutableSequence):
+    def __init__(self, size, parent, type):
+        _SubStructure.__init__(self, parent, type)
+        self._size = size
+        self._items = []
+
+    def __len__(self):
+        return len(self._items)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        item = self._items[index]
+        if isinstance(item, _Unparsed):
+            from mc4p.protocol import PacketData
+            item = self._type._item.parse(PacketData(item.data), self)
+            if isinstance(item, LazyJson):
+                item = item.decode()
+            self._items[index] = item
+        return item
+
+    def __setitem__(self, index, value):
+        self._items[index] = value
+        self._make_dirty()
+
+    def __delitem__(self, index):
+        del self._items[index]
+        self._make_dirty()
+
+    def insert(self, index, value):
+        self._items.insert(index, value)
+        self._make_dirty()
+
+
+class _SkipScope(object):
+    """Stands in for a parent structure while skipping over its fields"""
+    def __init__(self, parent):
+        self._parent = parent
+
+
+class _FixedArray(_SubStructure, array.array):
+    def __new__(cls, typecode, size, parent, type):
+        return array.array.__new__(cls, typecode)
+
+    def __init__(self, typecode, size, parent, type):
+        _SubStructure.__init__(self, parent, type)
+        self._size = size
+
+
+# array.array type codes able to hold each fixed-width struct format
+_ARRAY_TYPECODES = {
+    b"b": b"b", b"B": b"B", b"h": b"h", b"H": b"H", b"i": b"il",
+    b"I": b"IL", b"q": b"lq", b"Q": b"LQ", b"f": b"f", b"d": b"d",
+}
+_SWAP_ARRAYS = sys.byteorder == "little"
+
+
+def _array_typecode(format):
+    size = struct.calcsize(b">" + format)
+    for typecode in _ARRAY_TYPECODES.get(format, b""):
+        try:
+            if array.array(typecode).itemsize == size:
+                return typecode
+        except ValueError:  # "q" and "Q" are unavailable before Python 3.3
+            pass
+
+
+def _defers_decoding(field):
+    """Tells if ``field`` may parse a LazyJson value"""
+    if isinstance(field, Optional):
+        return _defers_decoding(field.val)
+    if isinstance(field, Switch):
+        return any(_defers_decoding(val) for val in field.valdict.values())
+    return isinstance(field, Json) or field is Json or field is Chat
+
+
+def has_conditions(field):
+    """
+    Tells if ``field``, or any field nested in it, is a Switch or Optional
+    whose encoding depends on the values of other fields
+    """
+    if isinstance(field, (Switch, Optional)):
+        return True
+    if isinstance(field, Array):
+        return has_conditions(field._item)
+    if isinstance(field, SubFields):
+        return any(has_conditions(subfield)
+                   for subfield in field.subfields.itervalues())
+    return False
+
+
+def _decoding_property(slot):
+    """Property decoding a LazyJson stored in ``slot`` on first access"""
+    get, set = slot.__get__, slot.__set__
+
+    def decode(self):
+        value = get(self)
+        if isinstance(value, LazyJson):
+            value = value.decode()
+            set(self, value)
+        return value
+
+    return property(decode, set)
+
+
 class Array(Field):
-    def __init__(self, size, item):
+    def __init__(self, size, item, lazy=False):
+        """
+        If ``lazy`` is set, parsing only records the raw bytes of each item
+        and decodes it on first access. Items which were never accessed are
+        emitted from their original bytes. Items are found by skipping them,
+        which limits what their conditions may read, see Field.skip.
+        """
         super(Array, self).__init__()
         self._size = size
         self._item = item
+        self._lazy = lazy
+        # Arrays of fixed-width numbers are decoded in bulk into array.array
+        if item._struct_format is not None:
+            self._typecode = _array_typecode(item._struct_format)
+            self._itemsize = struct.calcsize(b">" + item._struct_format)
+        else:
+            self._typecode = None
+        self._decode_items = _defers_decoding(item)
 
     def parse(self, data, parent=None):
         size = self._size.parse(data, parent)
+        if self._lazy and self._typecode is None:
+            arr = _LazyArray(size, parent, self)
+            bounds = [data.read_pos]
+            for i in range(size):
+                self._item.skip(data, arr)
+                bounds.append(data.read_pos)
+            raw = data.view(bounds[0], bounds[-1])
+            offset = bounds[0]
+            arr._items = [
+                _Unparsed(raw[start - offset:end - offset])
+                for start, end in zip(bounds, bounds[1:])
+            ]
+            arr._ready()
+            return arr
+
+        if self._typecode is not None:
+            arr = _FixedArray(self._typecode, size, parent, self)
+            arr.fromstring(data.read_bytes(size * arr.itemsize).tobytes())
+            if _SWAP_ARRAYS:
+                arr.byteswap()
+            arr._ready()
+            return arr
+
         arr = _Array(size, parent, self)
         for i in range(size):
             arr.append(self._item.parse(data, arr))
+        if self._decode_items:
+            arr[:] = [item.decode() if isinstance(item, LazyJson) else item
+                      for item in arr]
         arr._ready()
         return arr
 
+    def skip(self, data, parent=None):
+        size = self._size.parse(data, parent)
+        if self._typecode is not None:
+            data.skip(size * self._itemsize)
+        else:
+            scope = _SkipScope(parent)
+            for i in range(size):
+                self._item.skip(data, scope)
+        return SKIPPED
+
     def emit(self, value, parent=None):
+        if isinstance(value, _LazyArray):
+            return util.combine_memoryview(
+                self._size.emit(len(value), parent),
+                *(item.data if isinstance(item, _Unparsed)
+                  else self._item.emit(item, value)
+                  for item in value._items)
+            )
+
+        if self._typecode is not None:
+            if (isinstance(value, array.array) and
+                    value.typecode == self._typecode):
+                items = value.__copy__()
+            else:
+                items = array.array(self._typecode, value)
+            if _SWAP_ARRAYS:
+                items.byteswap()
+            return util.combine_memoryview(
+                self._size.emit(len(value), parent),
+                items.tostring()
+            )
+
         return util.combine_memoryview(
             self._size.emit(len(value), parent),
             *(self._item.emit(val, value) for val in value)
         )
 
+    def signature(self):
+        size, item = self._size.signature(), self._item.signature()
+        if size is None or item is None:
+            return None
+        return ("Array", size, item)
+
     def format(self, value):
         if value is None:
             return "None"
@@ -302,7 +808,29 @@ class Array(Field):
 
 
 class _SubFields(_SubStructure):
-    pass
+    """
+    Base of the slotted classes generated for each SubFields declaration.
+
+    Assignments propagate dirtiness to the parent unless both already have
+    their _dirty flag set, so repeated assignments stop here until the
+    parent is encoded again. Parents without the flag, like arrays, are
+    always told.
+    """
+    __slots__ = ("_parent", "_type", "_is_ready", "_dirty")
+
+    def __init__(self, parent, type):
+        _SubStructure.__init__(self, parent, type)
+        self._dirty = False
+
+    def _make_dirty(self, child=None):
+        if not self._is_ready:
+            return
+        parent = self._parent
+        if (not self._dirty or parent is not None and
+                not getattr(parent, "_dirty", False)):
+            self._dirty = True
+            if parent is not None:
+                parent._make_dirty(self)
 
 
 class SubFields(Field):
@@ -312,32 +840,63 @@ class SubFields(Field):
             ((name, field) for name, field in kwargs.iteritems()),
             key=lambda i: i[1]._order_id
         ))
+        # Fields which may hold a LazyJson are stored in a private slot and
+        # exposed through a property decoding it
+        self._storage = storage = dict(
+            (name, str("_raw_%s" % name) if _defers_decoding(field)
+             else str(name))
+            for name, field in self.subfields.iteritems()
+        )
+        self._class = type(str("_SubFields"), (_SubFields,), {
+            str("__slots__"): tuple(storage[name] for name in self.subfields),
+        })
+        for name, slot in storage.iteritems():
+            if slot != name:
+                setattr(self._class, name,
+                        _decoding_property(self._class.__dict__[slot]))
+        self._parse_fields = compile_parser(self.subfields, self._class)
+        self._emit_fields = compile_emitter(self.subfields, attributes=True,
+                                            storage=storage)
 
     def new_dummy(self, parent):
-        subfields = _SubFields(parent, self)
+        subfields = self._class(parent, self)
         for key, val in self.subfields.iteritems():
             setattr(subfields, key, None)
         subfields._ready()
         return subfields
 
     def parse(self, data, parent=None):
-        subfields = _SubFields(parent, self)
-        for key, val in self.subfields.iteritems():
-            setattr(subfields, key, val.parse(data, subfields))
+        subfields = self._class(parent, self)
+        self._parse_fields(data, subfields, subfields)
         subfields._ready()
         return subfields
 
+    def skip(self, data, parent=None):
+        scope = _SkipScope(parent)
+        for key, val in self.subfields.iteritems():
+            setattr(scope, key, val.skip(data, scope))
+        return scope
+
     def emit(self, value, parent=None):
-        return util.combine_memoryview(
-            *(val.emit(getattr(value, key), value)
-              for key, val in self.subfields.iteritems())
-        )
+        # Emitting re-arms the dirty propagation of value
+        value._dirty = False
+        return util.combine_memoryview(*self._emit_fields(value, value))
+
+    def signature(self):
+        # Values are matched up by name, so fields with the same format but
+        # another name don't encode the same value the same way
+        signatures = tuple((name, field.signature())
+                           for name, field in self.subfields.iteritems())
+        if any(signature is None for name, signature in signatures):
+            return None
+        return ("SubFields",) + signatures
 
     def format(self, value):
         if value is None:
             return "None"
         return "<SubFields: %s>" % ", ".join(
-            '{}: {}'.format(key, val.format(getattr(value, key)))
+            '{}: {}'.format(key, val.format(
+                getattr(value, self._storage[key])))
             for key, val in self.subfields.iteritems())
 
 
@@ -350,9 +909,16 @@ class Switch(Field):
     def parse(self, data, parent=None):
         return self.valdict[self.cond(parent)].parse(data, parent)
 
+    def skip(self, data, parent=None):
+        return self.valdict[self.cond(parent)].skip(data, parent)
+
     def emit(self, value, parent=None):
         return self.valdict[self.cond(parent)].emit(value, parent)
 
+    def signature(self):
+        # Conditions are arbitrary functions
+        return None
+
     def format(self, value):
         if value is None:
             return "None"
@@ -371,11 +937,18 @@ class Optional(Field):
         else:
             return None
 
+    def skip(self, data, parent=None):
+        if self.cond(parent):
+            return self.val.skip(data, parent)
+
     def emit(self, value, parent=None):
         if self.cond(parent):
             return self.val.emit(value, parent)
         else:
             return b''
 
+    def signature(self):
+        return None
+
     def format(self, value):
         return "<Optional: %s>" % repr(value)
@@ -14,11 +14,11 @@ from __future__ import absolute_import, unicode_literals
 import logging
 import re
 import collections
-import zlib
 import inspect
 import importlib
 import traceback
 
+from mc4p import compression
 from mc4p import parsing
 from mc4p import util
 
@@ -66,6 +66,11 @@ class ProtocolStateContext(object):
         self.state = state
         self.packets = {}
         self.handlers = {}
+        # Indexed by packet id, holds (packet class, handlers) or None for
+        # unknown ids. Rebuilt instead of modified when handlers change.
+        self.dispatch_table = []
+        # Ids of the packets any handler is registered for
+        self.handled_ids = frozenset()
 
     # Please look away for a second
 
@@ -84,30 +89,57 @@ class ProtocolStateContext(object):
                 packet._do_magic(self)
                 self.packets[packet.id] = packet
                 setattr(self, packet.__name__, packet)
+        self._build_dispatch_table()
 
     # Okay, you may look again
 
+    def _build_dispatch_table(self):
+        table = [None] * (max(self.packets) + 1 if self.packets else 0)
+        for id_, packet in self.packets.iteritems():
+            table[id_] = (packet, tuple(self.handlers.get(packet, ())))
+        self.dispatch_table = table
+        self.handled_ids = frozenset(
+            packet.id for packet, handlers in self.handlers.iteritems()
+            if handlers)
+
     def read_packet(self, data, strict_protocol=True):
-        id_ = parsing.VarInt.parse(data)
-        if id_ not in self.packets:
+        id_ = data.read_varint()
+        table = self.dispatch_table
+        entry = table[id_] if 0 <= id_ < len(table) else None
+        if entry is None:
             if not strict_protocol or self.protocol.incomplete:
                 return UnknownPacket(data, id_=id_)
             else:
                 raise InvalidPacketException(self, id_)
-        return self.packets[id_](_data=data, _strict_protocol=strict_protocol)
+        packet = entry[0]
+        if packet._free_list:
+            return packet._reuse(data, strict_protocol)
+        return packet(_data=data, _strict_protocol=strict_protocol)
 
     def register_packet_handler(self, packet, handler):
         self.handlers.setdefault(packet, []).append(handler)
+        self._build_dispatch_table()
+
+    def unregister_packet_handler(self, packet, handler):
+        self.handlers[packet].remove(handler)
+        self._build_dispatch_table()
 
     def handle_packet(self, packet, packet_stream):
-        handlers = self.handlers.get(packet.__class__)
-        if handlers:
-            contexts = [handler(packet, packet_stream) for handler in handlers]
-            contexts = [context for context in contexts if context]
-            if contexts:
-                if len(contexts) > 1:
+        table = self.dispatch_table
+        id_ = packet.id
+        if id_ is None or not 0 <= id_ < len(table):
+            return
+        entry = table[id_]
+        if entry is None or entry[0] is not packet.__class__:
+            return
+        new_context = None
+        for handler in entry[1]:
+            context = handler(packet, packet_stream)
+            if context:
+                if new_context:
                     raise Exception("More than one new protocol context set")
-                return contexts[0]
+                new_context = context
+        return new_context
 
     def __repr__(self):
         return "<ProtocolContext dir:%s state:%s version:%d>" % (
@@ -158,10 +190,19 @@ class UpgradedProtocolStateContext(object):
         self.direction = state_context.direction
         self.state = state_context.state
         self.original_state_context = state_context
+        self.packets = state_context.packets
 
         for packet in state_context.packets.itervalues():
             setattr(self, packet.__name__, packet)
 
+    @property
+    def dispatch_table(self):
+        return self.original_state_context.dispatch_table
+
+    @property
+    def handled_ids(self):
+        return self.original_state_context.handled_ids
+
     def read_packet(self, data):
         return self.original_state_context.read_packet(
             data, strict_protocol=False
@@ -182,21 +223,43 @@ class UpgradedProtocolStateContext(object):
             self.protocol.original_protocol.version)
 
 
+def _value_slot(name):
+    return str("_value_%s" % name)
+
+
+class _MetaPacket(type):
+    """Gives every packet class slots holding the values of its fields"""
+    def __new__(mcs, name, bases, namespace):
+        if "__slots__" not in namespace:
+            namespace["__slots__"] = tuple(
+                _value_slot(key) for key, value in namespace.iteritems()
+                if isinstance(value, parsing.Field)
+            )
+        return super(_MetaPacket, mcs).__new__(mcs, name, bases, namespace)
+
+
 class Packet(object):
+    __metaclass__ = _MetaPacket
+    __slots__ = ("_strict_protocol", "_invalid", "_parse_error",
+                 "_parse_traceback", "_parsed", "_dirty", "_data", "_spans",
+                 "_dirty_fields")
+
     _NAME_PATTERN = re.compile("(.)([A-Z])")
 
+    # Generate straight-line parse and encode functions in _do_magic
+    _compile_codecs = True
+    _parse_fields = None
+    _encode_fields = None
+    # Re-encode only modified fields and splice them into the original data
+    _spliceable = False
+    # Sent instances kept for reuse, see _enable_pool
+    _free_list = None
+    _pool_size = 0
+
     def __init__(self, _data=None, _strict_protocol=True,
                  _ignore_extra_fields=False, **fields):
-        self._strict_protocol = _strict_protocol
-        self._invalid = False
-        self._parse_error = False
-        self._parse_traceback = False
-
-        if _data:
-            self._parsed = False
-            self._data = _data
-            self._dirty = False
-        else:
+        self._reset(_data, _strict_protocol)
+        if not _data:
             self._parsed = True
             self._dirty = True
             for name, value in fields.iteritems():
@@ -208,48 +271,108 @@ class Packet(object):
                 if name not in fields:
                     setattr(self, name, None)
 
-    def _emit(self, compression_threshold=None):
+    def _reset(self, data, strict_protocol):
+        self._strict_protocol = strict_protocol
+        self._invalid = False
+        self._parse_error = False
+        self._parse_traceback = False
+
+        # Offsets of the field units within _data and the names of fields
+        # modified since, or None if they're unknown
+        self._spans = None
+        self._dirty_fields = None
+
+        self._parsed = False
+        self._data = data
+        self._dirty = False
+
+    @classmethod
+    def _enable_pool(cls, size=64):
+        """
+        Lets output streams hand up to size instances of this packet back
+        once they sent them, and reuses those for packets read afterwards.
+
+        Only for packets nobody keeps or sends twice: sending a packet of a
+        pooled class passes it on to the output stream, so it mustn't be
+        used afterwards.
+        """
+        cls._free_list = []
+        cls._pool_size = size
+
+    @classmethod
+    def _disable_pool(cls):
+        cls._free_list = None
+        cls._pool_size = 0
+
+    @classmethod
+    def _reuse(cls, data, strict_protocol=True):
+        try:
+            packet = cls._free_list.pop()
+        except IndexError:
+            # Another thread took the last one
+            return cls(_data=data, _strict_protocol=strict_protocol)
+        packet._reset(data, strict_protocol)
+        return packet
+
+    def _release(self):
+        """Returns a sent packet to its class's free list, if it has one"""
+        free_list = self._free_list
+        if free_list is None or len(free_list) >= self._pool_size:
+            return
+        for slot in self._storage.itervalues():
+            setattr(self, slot, None)
+        self._data = self._spans = self._dirty_fields = None
+        free_list.append(self)
+
+    def _emit(self, compression_threshold=None, compressor=None):
+        return util.combine_memoryview(
+            *self._emit_segments(compression_threshold, compressor))
+
+    def _emit_segments(self, compression_threshold=None, compressor=None):
+        """
+        Returns the framed packet as a list of buffers, which are views into
+        the packet data wherever possible. Packets which need to be
+        compressed are compressed with compressor, or the default one.
+        """
         if self._dirty:
             self._encode()
 
         if compression_threshold:
             if len(self._data) >= compression_threshold:
-                data = self._data.read_compressed()
+                segments = [self._data.read_compressed(compressor)]
                 uncompressed_length = parsing.VarInt.emit(len(self._data))
             else:
-                data = self._data.read()
+                segments = self._data.read_segments()
                 uncompressed_length = parsing.VarInt.emit(0)
-            return util.combine_memoryview(
-                parsing.VarInt.emit(len(data) + len(uncompressed_length)),
-                uncompressed_length,
-                data
-            )
+            length = (sum(len(segment) for segment in segments) +
+                      len(uncompressed_length))
+            return [parsing.VarInt.emit(length), uncompressed_length] + \
+                segments
         else:
-            return util.combine_memoryview(
-                parsing.VarInt.emit(len(self._data)),
-                self._data.read()
-            )
-
-    # Only completely parse a packet if necessary
-    def __getattribute__(self, attr):
-        field = super(Packet, self).__getattribute__(attr)
-        if attr[0] == "_" or self._parsed or attr not in self._fields:
-            return field
-        self._parse()
-        return super(Packet, self).__getattribute__(attr)
-
-    def __setattr__(self, attr, value):
-        if attr[0] != "_":
-            if not self._parsed:
-                self._parse()
-            self._dirty = True
-        super(Packet, self).__setattr__(attr, value)
+            return ([parsing.VarInt.emit(len(self._data))] +
+                    self._data.read_segments())
 
     def _parse(self):
-        # We're setting _parsed prematurely so __getattribute__ and __setattr__
-        # won't cause an infinite recursion loop
+        # We're setting _parsed prematurely so the field descriptors won't
+        # cause an infinite recursion loop
         self._parsed = True
 
+        if self._parse_fields is not None:
+            try:
+                self._spans = self._parse_fields(self._data, self, self)
+                self._dirty_fields = set()
+            except Exception as e:
+                if self._strict_protocol:
+                    raise
+                self._invalid = True
+                self._parse_error = e
+                self._parse_traceback = traceback.format_exc()
+                for slot in self._storage.itervalues():
+                    if not hasattr(self, slot):
+                        setattr(self, slot, None)
+            self._dirty = False
+            return
+
         for name, field in self._fields.iteritems():
             try:
                 setattr(self, name, field.parse(self._data, self))
@@ -266,17 +389,73 @@ class Packet(object):
         self._dirty = False
 
     def _encode(self):
-        self._data = PacketData(util.combine_memoryview(
-            parsing.VarInt.emit(self.id),
-            *tuple(
+        if (self._spliceable and self._spans is not None and
+                self._dirty_fields is not None):
+            self._splice()
+            return
+
+        packet_id = parsing.VarInt.emit(self.id)
+        if self._encode_fields is not None:
+            parts = self._encode_fields(self, self)
+            spans = [len(packet_id)]
+            for part in parts:
+                spans.append(spans[-1] + len(part))
+            self._spans = spans
+            self._dirty_fields = set()
+            self._data = SegmentedData([packet_id] + list(parts), spans[-1])
+        else:
+            parts = tuple(
                 field.emit(getattr(self, name), self)
                 for name, field in self._fields.iteritems()
             )
-        ))
+            self._data = SegmentedData([packet_id] + list(parts))
+        self._dirty = False
+
+    def _splice(self):
+        """Re-encodes modified fields between the untouched original bytes"""
+        dirty_fields = self._dirty_fields
+        if len(dirty_fields) == 1:
+            units = [self._field_units[next(iter(dirty_fields))]]
+        else:
+            units = sorted(set(map(self._field_units.__getitem__,
+                                   dirty_fields)))
+        emitters = self._unit_emitters
+        data = self._data
+        spans = self._spans
+        new_spans = list(spans)
+        parts = []
+        position = 0
+        # Untouched regions stay views into the original segments, so
+        # nothing is copied until the packet is sent
+        for unit in units:
+            start, end = spans[unit], spans[unit + 1]
+            part = emitters[unit](self, self)
+            if position < start:
+                parts.extend(data.view_segments(position, start))
+            parts.append(part)
+            position = end
+            shift = len(part) - (end - start)
+            if shift:
+                for i in xrange(unit + 1, len(new_spans)):
+                    new_spans[i] += shift
+        if position < data.length:
+            parts.extend(data.view_segments(position, data.length))
+
+        self._data = SegmentedData(parts, new_spans[-1])
+        self._spans = new_spans
+        self._dirty_fields = set()
         self._dirty = False
 
-    def _make_dirty(self):
+    def _make_dirty(self, child=None):
         self._dirty = True
+        if self._dirty_fields is None:
+            return
+        for name in self._fields:
+            if getattr(self, self._storage[name], None) is child is not None:
+                self._dirty_fields.add(name)
+                return
+        # A nested structure we can't attribute to a field
+        self._dirty_fields = None
 
     def __repr__(self):
         return "<%s Packet>" % self._name
@@ -292,7 +471,8 @@ class Packet(object):
             lines = ["%s Packet" % self._name]
 
             for name, field in self._fields.iteritems():
-                value = getattr(self, name)
+                # Let fields format undecoded values
+                value = getattr(self, self._storage[name])
                 if value:
                     value = field.format(value)
                 lines.append(
@@ -312,11 +492,73 @@ class Packet(object):
         cls._name = cls._NAME_PATTERN.sub(
             lambda g: "%s %s" % (g.group(1), g.group(2)), cls.__name__
         )
-        cls._fields = collections.OrderedDict(sorted(
-            ((name, field) for name, field in cls.__dict__.iteritems()
-             if isinstance(field, parsing.Field)),
-            key=lambda i: i[1]._order_id
-        ))
+        fields = []
+        for name, field in cls.__dict__.items():
+            if isinstance(field, _FieldDescriptor):
+                field = field.field
+            elif not isinstance(field, parsing.Field):
+                continue
+            fields.append((name, field))
+            setattr(cls, name, _FieldDescriptor(
+                name, field, cls.__dict__[_value_slot(name)]))
+        cls._fields = collections.OrderedDict(
+            sorted(fields, key=lambda i: i[1]._order_id))
+        # Names of the slots holding the field values
+        cls._storage = dict((name, _value_slot(name)) for name in cls._fields)
+        if cls._compile_codecs:
+            cls._parse_fields = staticmethod(parsing.compile_parser(
+                cls._fields, cls, offsets=True, storage=cls._storage))
+            cls._encode_fields = staticmethod(parsing.compile_emitter(
+                cls._fields, attributes=True, storage=cls._storage))
+            units = parsing.field_units(cls._fields, attributes=True,
+                                        storage=cls._storage)
+            cls._field_units = dict(
+                (name, i) for i, (names, emit) in enumerate(units)
+                for name in names
+            )
+            cls._unit_emitters = tuple(emit for names, emit in units)
+            # Fields depending on other fields can't be re-encoded alone
+            cls._spliceable = not any(
+                parsing.has_conditions(field)
+                for field in cls._fields.itervalues()
+            )
+        else:
+            cls._parse_fields = cls._encode_fields = None
+            cls._spliceable = False
+
+
+class _FieldDescriptor(object):
+    """
+    Only completely parses a packet once one of its fields is accessed.
+    The value itself is kept in the slot the field was given by _MetaPacket.
+    """
+    __slots__ = ("name", "field", "_get", "_set")
+
+    def __init__(self, name, field, slot):
+        self.name = name
+        self.field = field
+        self._get = slot.__get__
+        self._set = slot.__set__
+
+    def __get__(self, packet, cls=None):
+        if packet is None:
+            return self.field
+        if not packet._parsed:
+            packet._parse()
+        value = self._get(packet)
+        if isinstance(value, parsing.LazyJson):
+            # Decoding doesn't change the packet, so don't make it dirty
+            value = value.decode()
+            self._set(packet, value)
+        return value
+
+    def __set__(self, packet, value):
+        if not packet._parsed:
+            packet._parse()
+        packet._dirty = True
+        if packet._dirty_fields is not None:
+            packet._dirty_fields.add(self.name)
+        self._set(packet, value)
 
 
 class PacketData(object):
@@ -339,18 +581,96 @@ class PacketData(object):
         self.read_pos += n
         return data
 
-    def read_compressed(self):
-        return memoryview(zlib.compress(self.read().tobytes()))
+    def skip(self, n):
+        if self.length < self.read_pos + n:
+            raise IOError("Buffer underflow")
+        self.read_pos += n
+
+    def view(self, start, end):
+        """Returns a view of bytes which have already been read"""
+        return self.data[start:end]
+
+    def view_segments(self, start, end):
+        """Returns the bytes between start and end as a list of buffers"""
+        return [self.data[start:end]]
+
+    def read_varint(self):
+        try:
+            value, self.read_pos = parsing.decode_varint(self.data,
+                                                         self.read_pos)
+        except IndexError:
+            raise IOError("Buffer underflow")
+        return value
+
+    def unpack(self, struct_):
+        """Unpacks a precompiled struct directly from the buffer"""
+        if self.length < self.read_pos + struct_.size:
+            raise IOError("Buffer underflow")
+        values = struct_.unpack_from(self.data, self.read_pos)
+        self.read_pos += struct_.size
+        return values
+
+    def read_segments(self):
+        """Returns the whole data as a list of buffers"""
+        return [self.read()]
+
+    def read_compressed(self, compressor=None):
+        compressor = compressor or compression.DEFAULT_COMPRESSOR
+        return memoryview(compressor.compress(self.read_segments()))
 
     def __len__(self):
         return self.length
 
 
+class SegmentedData(PacketData):
+    """
+    Packet data made up of several buffers, like freshly encoded fields and
+    views into the data they were spliced into. The buffers are only joined
+    once the data is read as a whole.
+    """
+    def __init__(self, segments, length=None):
+        self.segments = segments
+        if length is None:
+            length = sum(len(segment) for segment in segments)
+        self.length = length
+        self.read_pos = 0
+        self._joined = None
+
+    @property
+    def data(self):
+        if self._joined is None:
+            self._joined = memoryview(
+                util.combine_memoryview(*self.segments))
+        return self._joined
+
+    def read_segments(self):
+        if self._joined is not None:
+            return [self._joined]
+        return list(self.segments)
+
+    def view_segments(self, start, end):
+        if self._joined is not None:
+            return [self._joined[start:end]]
+        views = []
+        offset = 0
+        for segment in self.segments:
+            length = len(segment)
+            if offset + length > start and offset < end:
+                views.append(memoryview(segment)[max(start - offset, 0):
+                                                 min(end - offset, length)])
+            offset += length
+        return views
+
+
 class UnknownPacket(Packet):
+    __slots__ = ("_id",)
+
     _state = None
     _direction = None
+    _context = None
     _name = "Unknown"
     _fields = {}
+    _storage = {}
 
     def __init__(self, data, id_=None):
         super(UnknownPacket, self).__init__(data)
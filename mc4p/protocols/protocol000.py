@@ -99,7 +99,7 @@ with protocol.server_bound.play:
 
     class PluginMessage(Packet):
         id = 0x17
-        channel = String()
+        channel = String(intern=True)
         data = Data(Short())
 
         def parse_as_string(self):
@@ -118,7 +118,7 @@ with protocol.client_bound.play:
         dimension = Byte()
         difficulty = UnsignedByte()
         max_players = UnsignedByte()
-        level_type = String()
+        level_type = String(intern=True)
 
     class ChatMessage(Packet):
         id = 0x02
@@ -160,13 +160,13 @@ with protocol.client_bound.play:
 
     class Teams(Packet):
         id = 0x3e
-        team_name = String()
+        team_name = String(intern=True)
         mode = Byte()
         data = Data()
 
     class PluginMessage(Packet):
         id = 0x3f
-        channel = String()
+        channel = String(intern=True)
         data = Data(Short())
 
         def parse_as_string(self):
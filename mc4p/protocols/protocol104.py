@@ -89,7 +89,7 @@ with protocol.server_bound.play:
 
     class PluginMessage(Packet):
         id = 0x09
-        channel = String()
+        channel = String(intern=True)
         data = Data()
 
         def parse_as_string(self):
@@ -117,7 +117,7 @@ with protocol.client_bound.play:
 
     class PluginMessage(Packet):
         id = 0x18
-        channel = String()
+        channel = String(intern=True)
         data = Data()
 
         def parse_as_string(self):
@@ -146,7 +146,7 @@ with protocol.client_bound.play:
         dimension = Byte()
         difficulty = UnsignedByte()
         max_players = UnsignedByte()
-        level_type = String()
+        level_type = String(intern=True)
         reduced_debug_info = Bool()
 
     class PlayerAbilities(Packet):
@@ -167,7 +167,7 @@ with protocol.client_bound.play:
 
     class Teams(Packet):
         id = 0x41
-        team_name = String()
+        team_name = String(intern=True)
         mode = Byte()
         data = Data()
 
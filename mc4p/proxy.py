@@ -15,7 +15,7 @@ import importlib
 import logging
 from multiprocessing.managers import BaseManager
 
-from mc4p import network, rcon
+from mc4p import compression, network, rcon
 
 
 class Proxy(object):
@@ -28,10 +28,20 @@ class Proxy(object):
 
 
 class ProxyServer(network.Server):
-    def __init__(self, addr, remote_addr, plugins=(), rcon=None):
+    def __init__(self, addr, remote_addr, plugins=(), rcon=None,
+                 client_compressor=None, server_compressor=None,
+                 workers=None, flush_delay=None):
         super(ProxyServer, self).__init__(addr, ProxyClientHandler)
         self.remote_addr = remote_addr
         self.plugins = plugins
+        # compression.Compressor for packets sent to either side, which
+        # shouldn't be the same instance if it adapts to what it compresses
+        self.client_compressor = client_compressor
+        self.server_compressor = server_compressor
+        # compression.WorkerPool shared by all streams of a process
+        self.workers = workers
+        # Seconds forwarded packets may wait for more to be sent along
+        self.flush_delay = flush_delay
         self.manager = type(str('MCManager'), (BaseManager,), {})
 
         if rcon:
@@ -60,9 +70,18 @@ class ProxyServer(network.Server):
 
 
 class ProxyClientHandler(network.ClientHandler):
+    forward_raw_frames = True
+
     def init(self):
         self.logger = logging.getLogger("proxy.client")
         self.real_server = ProxyClient(self.server.remote_addr, self)
+        self.output_stream.compressor = self.server.client_compressor
+        self.real_server.output_stream.compressor = \
+            self.server.server_compressor
+        for endpoint in (self, self.real_server):
+            endpoint.input_stream.workers = self.server.workers
+            endpoint.output_stream.workers = self.server.workers
+            endpoint.output_stream.flush_delay = self.server.flush_delay
 
         self.proxy = Proxy(self.server, self, self.real_server)
         self.real_server.proxy = self.proxy
@@ -75,9 +94,12 @@ class ProxyClientHandler(network.ClientHandler):
         for plugin in self.proxy.plugins:
             plugin.on_connect(self.proxy)
 
-    def recv(self):
-        super(ProxyClientHandler, self).recv()
-        self.real_server.flush()
+    def handle_packets_read(self):
+        self.real_server.schedule_flush()
+
+    def throttle(self):
+        # Stop reading from the client while the server is behind
+        self.real_server.wait_for_room()
 
     def handle_disconnect(self):
         super(ProxyClientHandler, self).handle_disconnect()
@@ -103,6 +125,8 @@ class ProxyClientHandler(network.ClientHandler):
 
 
 class ProxyClient(network.Client):
+    forward_raw_frames = True
+
     def __init__(self, addr, server):
         super(ProxyClient, self).__init__(addr, version=0)
         self.logger = logging.getLogger("proxy.server")
@@ -112,9 +136,11 @@ class ProxyClient(network.Client):
         self.real_client.send(packet)
         return True
 
-    def recv(self):
-        super(ProxyClient, self).recv()
-        self.real_client.flush()
+    def handle_packets_read(self):
+        self.real_client.schedule_flush()
+
+    def throttle(self):
+        self.real_client.wait_for_room()
 
     def handle_disconnect(self):
         super(ProxyClient, self).handle_disconnect()
@@ -144,6 +170,25 @@ if __name__ == "__main__":
                         help='Rcon connection to the server',
                         nargs=2,
                         metavar=('port', 'password'))
+    parser.add_argument('--compression-level',
+                        help='zlib level of packets compressed by the proxy',
+                        type=int)
+    parser.add_argument('--compression-strategy',
+                        help='zlib strategy of packets compressed by the '
+                             'proxy',
+                        choices=sorted(compression.STRATEGIES))
+    parser.add_argument('--adaptive-compression',
+                        help='lower the compression level while compressing '
+                             'takes too much CPU time',
+                        action='store_true')
+    parser.add_argument('--compression-threads',
+                        help='compress and inflate large packets on this '
+                             'many threads, 0 for one per CPU',
+                        type=int)
+    parser.add_argument('--flush-delay',
+                        help='milliseconds forwarded packets may wait to be '
+                             'sent together with later ones',
+                        type=float)
     parser.add_argument('-v', '--verbose',
                         help='verbose mode',
                         action='store_true')
@@ -173,6 +218,27 @@ if __name__ == "__main__":
         module = importlib.import_module('mc4p.plugins.%s' % pname)
         plugins.append(module.load_plugin(*pargs))
 
+    strategy = compression.STRATEGIES[args.compression_strategy or 'default']
+
+    def make_compressor():
+        if args.adaptive_compression:
+            return compression.AdaptiveCompressor(strategy=strategy)
+        elif args.compression_level is not None:
+            return compression.Compressor(args.compression_level, strategy)
+        elif args.compression_strategy is not None:
+            return compression.Compressor(strategy=strategy)
+        else:
+            return None
+
+    if args.compression_threads is not None:
+        workers = compression.WorkerPool(args.compression_threads or None)
+    else:
+        workers = None
+
     server = ProxyServer(
-        ('', args.port), (args.remote_host, args.remote_port), plugins, server_rcon)
+        ('', args.port), (args.remote_host, args.remote_port), plugins, server_rcon,
+        client_compressor=make_compressor(),
+        server_compressor=make_compressor(),
+        workers=workers,
+        flush_delay=args.flush_delay and args.flush_delay / 1000)
     server.run()
@@ -12,17 +12,73 @@
 from __future__ import (
     division, absolute_import, print_function, unicode_literals)
 
+import collections
 import logging
+import socket
+import time
 import zlib
 
 import threading
 
+from mc4p import compression
 from mc4p import protocol
+from mc4p import parsing
 from mc4p import encryption
+from mc4p import util
 
 logger = logging.getLogger("stream")
 
+# Bytes queued by output streams before they're flushed, and the size input
+# buffers grow to while every recv fills them
 BUFFER_SIZE = 1 << 20
+# Size input buffers start at, and shrink back to while idle
+INITIAL_BUFFER_SIZE = 1 << 14
+# Size input buffers may grow to in order to hold a single large frame
+MAX_BUFFER_SIZE = 1 << 22
+
+
+def _has_views(buffer):
+    try:
+        # bytearrays can't be resized while views of them exist
+        buffer.append(0)
+        buffer.pop()
+    except BufferError:
+        return True
+    return False
+
+
+class BufferPool(object):
+    """
+    Recycles the bytearrays of input streams by size.
+
+    Buffers are only taken back once no views of them are left, as views
+    handed out for frames must never see their data change. The pool holds
+    at most max_bytes, so it doesn't keep memory busy streams gave up.
+    """
+    def __init__(self, max_bytes=1 << 18):
+        self.max_bytes = max_bytes
+        self.bytes_held = 0
+        self._free = collections.defaultdict(list)
+        self._lock = threading.Lock()
+
+    def get(self, size):
+        with self._lock:
+            free = self._free.get(size)
+            if free:
+                self.bytes_held -= size
+                return free.pop()
+        return bytearray(size)
+
+    def put(self, buffer):
+        if _has_views(buffer):
+            return
+        with self._lock:
+            if self.bytes_held + len(buffer) <= self.max_bytes:
+                self._free[len(buffer)].append(buffer)
+                self.bytes_held += len(buffer)
+
+
+BUFFER_POOL = BufferPool()
 
 
 class PacketStream(object):
@@ -62,53 +118,89 @@ class PacketStream(object):
 
 
 class BufferedPacketStream(PacketStream):
+    """
+    Receives data into a linear buffer, so every frame can be handed out as
+    a single view.
+
+    The buffer starts at INITIAL_BUFFER_SIZE. It doubles while every recv
+    fills it, up to BUFFER_SIZE, or while a frame doesn't fit, up to
+    MAX_BUFFER_SIZE, and halves again on recvs which leave it mostly empty.
+    Unread data is moved to a new buffer instead of the start of the old
+    one, and received data only overwrites consumed frames once nothing
+    references them anymore, so views handed out earlier stay valid.
+    """
     def __init__(self, direction, version=0):
         super(BufferedPacketStream, self).__init__(direction, version)
-        self.buf = memoryview(bytearray(BUFFER_SIZE))
+        self._buffer = BUFFER_POOL.get(INITIAL_BUFFER_SIZE)
+        self.buf = memoryview(self._buffer)
         self.write_pos = 0
         self.read_pos = 0
-        # when read_pos == write_pos, indicate if buffer is full or empty
-        self.full = False
+        # Bytes the last recv returned and whether that was all it could
+        self._received = 0
+        self._saturated = False
         self._lock = threading.Lock()
 
     def enable_encryption(self, shared_secret):
         assert not self.bytes_used
         super(BufferedPacketStream, self).enable_encryption(shared_secret)
-        self.buf = memoryview(bytearray(BUFFER_SIZE))
-
-    def _write(self, buf_func):
-        if self.read_pos > self.write_pos:
-            part = self.buf[self.write_pos:self.read_pos]
+        self._replace(len(self._buffer))
+
+    def _replace(self, size):
+        """Moves the unread data to the start of a new buffer"""
+        unread = self.bytes_used
+        buffer = BUFFER_POOL.get(size)
+        buffer[:unread] = self.buf[self.read_pos:self.write_pos]
+        old, self._buffer = self._buffer, buffer
+        self.buf = memoryview(buffer)
+        self.read_pos = 0
+        self.write_pos = unread
+        BUFFER_POOL.put(old)
+
+    def _make_room(self):
+        """Resizes or compacts the buffer as needed before a recv"""
+        size = len(self._buffer)
+        unread = self.bytes_used
+        if not unread and self.write_pos:
+            # Start over at the beginning, unless frames read from the
+            # buffer are still being referenced
+            self.buf = None
+            if not _has_views(self._buffer):
+                self.read_pos = self.write_pos = 0
+            self.buf = memoryview(self._buffer)
+
+        if self._saturated and size < BUFFER_SIZE:
+            self._replace(size * 2)
+        elif size - self.write_pos >= size // 4:
+            if (not unread and size > INITIAL_BUFFER_SIZE and
+                    self._received < size // 4):
+                self._replace(size // 2)
+        elif unread > size // 2 and size < MAX_BUFFER_SIZE:
+            self._replace(size * 2)
+        elif unread < size:
+            self._replace(size)
         else:
-            part = self.buf[self.write_pos:]
-
-        if self.full:
             raise IOError("Buffer overflow")
 
+    def _write(self, buf_func):
+        self._make_room()
+        part = self.buf[self.write_pos:]
+
         n = buf_func(part)
+        self._received = n
+        self._saturated = n == len(part)
         if n:
             logger.debug('recv {} bytes'.format(n))
 
             if self._cipher is not None:
-                part[:n] = self._cipher.decrypt(part[:n].tobytes())
+                self._cipher.decrypt_into(part[:n], part)
 
-            self.write_pos = (self.write_pos + n) % BUFFER_SIZE
-            self.full = self.read_pos == self.write_pos
+            self.write_pos += n
 
         return n
 
     @property
     def bytes_used(self):
-        if self.write_pos > self.read_pos:
-            return self.write_pos - self.read_pos
-        elif self.read_pos == self.write_pos:
-            return BUFFER_SIZE if self.full else 0
-        else:
-            return BUFFER_SIZE - self.read_pos + self.write_pos
-
-    @property
-    def bytes_avail(self):
-        return BUFFER_SIZE - self.bytes_used
+        return self.write_pos - self.read_pos
 
     def _read(self, n=None):
         if n is None:
@@ -117,148 +209,569 @@ class BufferedPacketStream(PacketStream):
             raise PartialPacketException
         data = self.buf[self.read_pos:self.read_pos + n]
         self.read_pos += n
-        if self.read_pos > BUFFER_SIZE:
-            logger.debug("Rewinding buffer")
-            self.read_pos -= BUFFER_SIZE
-            data = data.tobytes() + self.buf[:self.read_pos].tobytes()
         return data
 
 
 class BufferedPacketInputStream(BufferedPacketStream):
+    def __init__(self, direction, version=0):
+        super(BufferedPacketInputStream, self).__init__(direction, version)
+        # Called with the current context to get the ids of the packets
+        # which need to be parsed, everything else is read as a RawFrame.
+        # None parses all packets.
+        self.interesting_ids = None
+        # compression.WorkerPool inflating large packets ahead of the ones
+        # being handled, None inflates them inline as they're parsed
+        self.workers = None
+
     def recv_from(self, sock):
         with self._lock:
             return self._write(sock.recv_into)
 
+    def _read_frame(self):
+        """Consumes the next frame, returning its body and data"""
+        last_boundary = self.read_pos
+        try:
+            length = self._read_varint()
+            if self.compression_threshold is not None:
+                uncompressed_length, varint_length = self._read_varint(True)
+                length -= varint_length
+            else:
+                uncompressed_length = 0
+
+            body = self._read(length)
+        except PartialPacketException:
+            self.read_pos = last_boundary
+            raise
+        data = BufferView(body)
+        if uncompressed_length:
+            data = CompressedData(data, uncompressed_length)
+        return body, uncompressed_length, data
+
+    def _decode_frame(self, body, uncompressed_length, data):
+        if self.interesting_ids is not None:
+            id_ = data.read_varint()
+            if id_ not in self.interesting_ids(self.context):
+                return RawFrame(self.context, id_, body,
+                                uncompressed_length,
+                                self.compression_threshold)
+            data.read_pos = 0
+
+        packet = self.context.read_packet(data)
+        new_context = self.context.handle_packet(packet, self)
+        if new_context:
+            self.change_context(new_context)
+        return packet
+
     def read_packet(self):
         with self._lock:
-            last_boundary = self.read_pos
+            return self._decode_frame(*self._read_frame())
+
+    def read_packets(self):
+        """
+        Decodes all complete frames received so far, which are split at once.
+        If a packet enables compression, the frames after it are split
+        again with the new framing.
+        """
+        while True:
+            with self._lock:
+                compressed = self.compression_threshold is not None
+                frames = self._split_frames()
+            if not frames:
+                return
+
+            if self.workers is not None and compressed:
+                ahead = self._inflate_ahead(frames)
+            else:
+                ahead = None
+            for i, (start, body, uncompressed_length, data) in \
+                    enumerate(frames):
+                if ahead is not None:
+                    next(ahead)
+                packet = self._decode_frame(body, uncompressed_length, data)
+                if (self.compression_threshold is not None) != compressed:
+                    if i + 1 < len(frames):
+                        with self._lock:
+                            self.read_pos = frames[i + 1][0]
+                    yield packet
+                    break
+                yield packet
+            else:
+                return
+
+    def _split_frames(self):
+        """
+        Consumes all complete frames in the buffer, returning a list of
+        (start, body, uncompressed length, data) tuples. A trailing partial
+        frame is left in the buffer.
+        """
+        # Decoding fails at the end of the received data, not the buffer
+        view = self.buf[:self.write_pos]
+        end = self.write_pos
+        pos = self.read_pos
+        compressed = self.compression_threshold is not None
+        decode_varint = parsing.decode_varint
+        frames = []
+        while pos < end:
+            start = pos
             try:
-                length = self._read_varint()
-                if self.compression_threshold is not None:
-                    uncompressed_length, varint_length = self._read_varint(True)
-                    length -= varint_length
+                length, pos = decode_varint(view, pos)
+                frame_end = pos + length
+                if frame_end > end:
+                    break
+                if compressed:
+                    uncompressed_length, pos = decode_varint(view, pos)
                 else:
                     uncompressed_length = 0
-
-                data = BufferView(self._read(length))
-                if uncompressed_length:
-                    data = CompressedData(data, uncompressed_length)
-            except PartialPacketException:
-                self.read_pos = last_boundary
-                raise
-            else:
-                packet = self.context.read_packet(data)
-                new_context = self.context.handle_packet(packet, self)
-                if new_context:
-                    self.change_context(new_context)
-
-                self.full = False
-                return packet
-
-    def read_packets(self):
-        try:
-            while True:
-                yield self.read_packet()
-        except PartialPacketException:
-            pass
+            except IndexError:
+                break
+            body = view[pos:frame_end]
+            pos = frame_end
+            data = BufferView(body)
+            if uncompressed_length:
+                data = CompressedData(data, uncompressed_length)
+            frames.append((start, body, uncompressed_length, data))
+            self.read_pos = pos
+        return frames
+
+    def _inflate_ahead(self, frames):
+        """
+        Starts inflating large frames on the worker pool, at most two per
+        worker ahead of the frame being decoded. Advanced once per frame.
+        """
+        workers = self.workers
+        cutoff = max(workers.cutoff, self.compression_threshold)
+        window = 2 * workers.workers
+        inflating = collections.deque()
+        ahead = 0
+        for i in range(len(frames)):
+            while inflating and inflating[0] < i:
+                inflating.popleft()
+            while ahead < len(frames) and len(inflating) < window:
+                uncompressed_length, data = frames[ahead][2:]
+                if (uncompressed_length >= cutoff and
+                        self._is_interesting(data)):
+                    data.inflate_on(workers)
+                    inflating.append(ahead)
+                ahead += 1
+            yield
+
+    def _is_interesting(self, data):
+        # Frames which will be forwarded raw don't need to be inflated
+        if self.interesting_ids is None:
+            return True
+        id_ = data.read_varint()
+        data.read_pos = 0
+        return id_ in self.interesting_ids(self.context)
 
     def _read_varint(self, return_length=False):
-        value = 0
-        for i in range(5):
-            b = ord(self._read(1)[0])
-            value |= (b & 0x7F) << 7 * i
-            if not b & 0x80:
-                if return_length:
-                    return value, i + 1
-                else:
-                    return value
-        raise IOError("Encountered varint longer than 5 bytes")
+        buf = self.buf
+        pos = self.read_pos
+        if self.write_pos - pos < 5:
+            # Don't decode stale bytes past the received data
+            buf = buf[:self.write_pos]
+        try:
+            value, self.read_pos = parsing.decode_varint(buf, pos)
+        except IndexError:
+            raise PartialPacketException
+        if return_length:
+            return value, self.read_pos - pos
+        return value
 
 
 class PacketOutputStream(PacketStream):
+    def __init__(self, direction, version=0):
+        super(PacketOutputStream, self).__init__(direction, version)
+        # compression.Compressor for packets which need to be compressed,
+        # None uses the default one
+        self.compressor = None
+        # Packets sent and the send calls it took
+        self.packets_sent = 0
+        self.send_calls = 0
+
+    @property
+    def send_calls_per_packet(self):
+        if not self.packets_sent:
+            return 0.0
+        return self.send_calls / self.packets_sent
+
     def _emit(self, packet):
-        data = packet._emit(self.compression_threshold)
+        segments = packet._emit_segments(self.compression_threshold,
+                                         self.compressor)
+        self._handle_sent(packet)
+        return segments
 
+    def _handle_sent(self, packet):
         new_context = self.context.handle_packet(packet, self)
         if new_context:
             self.change_context(new_context)
 
-        if self._cipher is not None:
-            data = self._cipher.encrypt(data.tobytes())
-
-        return data
+    def _encrypt(self, segments):
+        """
+        Joins a list of buffers into a single new one and encrypts that in
+        place, with one call to the cipher.
+        """
+        if self._cipher is None:
+            return segments
+        length = sum(len(segment) for segment in segments)
+        out = memoryview(bytearray(length + encryption.OUTPUT_SLACK))
+        pos = 0
+        for segment in segments:
+            end = pos + len(segment)
+            out[pos:end] = segment
+            pos = end
+        data = out[:length]
+        self._cipher.encrypt_into(data, out)
+        return [data]
 
     def send(self, sock, packet):
-        sock.sendall(self._emit(packet))
+        self.send_calls += util.send_segments(
+            sock, self._encrypt(self._emit(packet)))
+        self.packets_sent += 1
+        if getattr(packet, "_free_list", None) is not None:
+            packet._release()
 
     def flush(self, sock):
         pass
 
+    def schedule_flush(self, sock):
+        pass
 
-class BufferedPacketOutputStream(PacketOutputStream, BufferedPacketStream):
-    def send(self, sock, packet):
-        data = self._emit(packet)
-        if len(data) > self.bytes_avail:
-            self.flush(sock)
+    def close(self):
+        pass
 
-        if len(data) > self.bytes_avail:
-            raise IOError("Buffer overflow")
+
+class BufferedPacketOutputStream(PacketOutputStream):
+    """
+    Queues the buffers of sent packets until they're flushed.
+
+    The queue is sent with as few calls as possible once it reaches
+    flush_watermark bytes, when flush is called, or flush_delay seconds
+    after schedule_flush was called, which gives packets sent in the
+    meantime the chance to go along. Full queues and delayed flushes are
+    sent by a thread of the stream's own, started on first use, so a slow
+    socket only holds up its own stream. Large packets are compressed on the
+    worker pool if there is one, and waited for in order when the stream is
+    flushed. Encrypted streams encrypt everything flushed at once.
+
+    Packets of classes with a pool, see Packet._enable_pool, are released
+    once the flush sending them is done.
+
+    Packets can be queued while a flush is sending. Whoever feeds the stream
+    should call wait_for_room before reading more, so the backlog stops
+    growing once it reaches high_watermark until it's down to
+    low_watermark again.
+    """
+    def __init__(self, direction, version=0):
+        super(BufferedPacketOutputStream, self).__init__(direction, version)
+        # Lists of buffers or compression.Jobs returning them, one per
+        # packet and not encrypted yet
+        self.pending = []
+        # Packets of pooled classes in pending, released once they're sent
+        self._pooled = []
+        self.bytes_used = 0
+        self._lock = threading.Lock()
+        # Held while sending, so flushes stay in order
+        self._flush_lock = threading.Lock()
+        # compression.WorkerPool compressing large packets, None compresses
+        # them inline
+        self.workers = None
+        self.flush_watermark = BUFFER_SIZE
+        # None flushes as soon as a flush is scheduled
+        self.flush_delay = None
+        # When the flush thread flushes next and the socket it sends to
+        self._flush_deadline = None
+        self._flush_sock = None
+        self._flush_ready = threading.Condition(self._lock)
+        self._flush_thread = None
+        self._closed = False
+
+        self.high_watermark = 2 * BUFFER_SIZE
+        self.low_watermark = BUFFER_SIZE // 2
+        # Bytes of the flush being sent
+        self._sending = 0
+        self._throttled = False
+        self._drained = threading.Condition()
+
+    @property
+    def backlog(self):
+        """Bytes queued or being sent"""
+        return self.bytes_used + self._sending
+
+    def wait_for_room(self, timeout=None):
+        """
+        Waits for the backlog to drop to low_watermark if it has reached
+        high_watermark. Returns whether it's below the watermarks, which it
+        may not be yet after timeout seconds.
+        """
+        with self._drained:
+            if self.backlog >= self.high_watermark:
+                self._throttled = True
+            if self._throttled:
+                if self.backlog > self.low_watermark:
+                    self._drained.wait(timeout)
+                if self.backlog > self.low_watermark:
+                    return False
+                self._throttled = False
+            return True
+
+    def enable_encryption(self, shared_secret):
+        assert not self.bytes_used
+        super(BufferedPacketOutputStream, self).enable_encryption(
+            shared_secret)
+
+    def _offload(self, packet):
+        """
+        Emits the packet on the worker pool if it's going to be compressed
+        and is large enough, returning the Job, otherwise returns None.
+        """
+        workers = self.workers
+        threshold = self.compression_threshold
+        if (workers is None or not threshold or
+                not isinstance(packet, protocol.Packet)):
+            return None
+        if packet._dirty:
+            packet._encode()
+        if (len(packet._data) < max(threshold, workers.cutoff) or
+                isinstance(packet._data, CompressedData)):
+            # Unmodified packets which were received compressed are sent as
+            # the original compressed bytes
+            return None
+        job = workers.submit(packet._emit_segments, threshold,
+                             self.compressor)
+        self._handle_sent(packet)
+        return job
+
+    def send(self, sock, packet):
+        entry = self._offload(packet)
+        if entry is None:
+            entry = self._emit(packet)
+            length = sum(len(segment) for segment in entry)
+        else:
+            # Compressed packets are smaller than this, or barely larger
+            length = len(packet._data)
 
         with self._lock:
-            data = [data]  # Python variable scoping
-            while data[0]:
-                def buf_func(buf):
-                    n = min(len(data[0]), len(buf))
-                    buf[:n] = data[0][:n]
-                    data[0] = data[0][n:]
-                    return n
-                self._write(buf_func)
+            full = (self.bytes_used < self.flush_watermark <=
+                    self.bytes_used + length)
+            self.pending.append(entry)
+            self.bytes_used += length
+            if getattr(packet, "_free_list", None) is not None:
+                self._pooled.append(packet)
+        if full:
+            # Don't block whoever is sending on a slow socket, they'll be
+            # throttled by wait_for_room instead
+            self._flush_at(time.time(), sock)
 
     def flush(self, sock):
+        with self._flush_lock:
+            with self._lock:
+                self._flush_deadline = None
+                pending, self.pending = self.pending, []
+                pooled, self._pooled = self._pooled, []
+                self._sending, self.bytes_used = self.bytes_used, 0
+            if not pending:
+                return
+            logger.debug('real send {} bytes'.format(self._sending))
+            try:
+                segments = []
+                for entry in pending:
+                    if isinstance(entry, compression.Job):
+                        entry = entry.result()
+                    segments.extend(entry)
+                segments = self._encrypt(segments)
+                self.send_calls += util.send_segments(sock, segments)
+                self.packets_sent += len(pending)
+                for packet in pooled:
+                    packet._release()
+            finally:
+                with self._drained:
+                    self._sending = 0
+                    self._drained.notify_all()
+
+    def schedule_flush(self, sock):
+        """
+        Has the flush thread flush the stream after flush_delay, or right
+        away if that's None. Unlike flush, this never blocks on the socket.
+        """
+        self._flush_at(time.time() + (self.flush_delay or 0), sock)
+
+    def close(self):
+        """Stops the flush thread, unsent packets are dropped"""
         with self._lock:
-            data = self._read()
-            if data:
-                logger.debug('real send {} bytes'.format(len(data)))
-                sock.sendall(data)
+            self._closed = True
+            self._flush_ready.notify()
+
+    def _flush_at(self, deadline, sock):
+        """Has the flush thread flush the queue at deadline, or earlier"""
+        with self._lock:
+            if self._closed or not self.pending:
+                return
+            if self._flush_deadline is None or deadline < self._flush_deadline:
+                self._flush_deadline = deadline
+                self._flush_sock = sock
+                self._flush_ready.notify()
+            if self._flush_thread is None:
+                self._flush_thread = threading.Thread(
+                    target=self._run_flushes, name="flush")
+                self._flush_thread.daemon = True
+                self._flush_thread.start()
+
+    def _run_flushes(self):
+        while True:
+            with self._lock:
+                while self._flush_deadline is None and not self._closed:
+                    self._flush_ready.wait()
+                if self._closed:
+                    return
+                timeout = self._flush_deadline - time.time()
+                if timeout > 0:
+                    self._flush_ready.wait(timeout)
+                    continue
+                sock = self._flush_sock
+            try:
+                self.flush(sock)
+            except socket.error as e:
+                # The endpoint finds out itself once it sends or receives
+                logger.debug("Scheduled flush failed: %s", e)
+            except Exception:
+                logger.exception("Scheduled flush failed")
 
 
 class PartialPacketException(Exception):
     pass
 
 
+class RawFrame(object):
+    """
+    A packet nobody is interested in, kept as the bytes it was received as.
+
+    It can be sent like a packet. The frame is forwarded as is if the
+    compression threshold didn't change, otherwise it's parsed and re-emitted.
+    """
+
+    def __init__(self, context, id_, body, uncompressed_length,
+                 compression_threshold):
+        self._context = context
+        self.id = id_
+        self.body = body
+        self.uncompressed_length = uncompressed_length
+        self.compression_threshold = compression_threshold
+
+    @property
+    def _state(self):
+        return self._context.state
+
+    @property
+    def _direction(self):
+        return self._context.direction
+
+    @property
+    def _name(self):
+        packet = self._context.packets.get(self.id)
+        return packet._name if packet is not None else "Unknown"
+
+    def parse(self):
+        data = BufferView(self.body)
+        if self.uncompressed_length:
+            data = CompressedData(data, self.uncompressed_length)
+        return self._context.read_packet(data)
+
+    def _emit(self, compression_threshold=None, compressor=None):
+        return util.combine_memoryview(
+            *self._emit_segments(compression_threshold, compressor))
+
+    def _emit_segments(self, compression_threshold=None, compressor=None):
+        if compression_threshold != self.compression_threshold:
+            return self.parse()._emit_segments(compression_threshold,
+                                               compressor)
+        if compression_threshold is None:
+            return [parsing.VarInt.emit(len(self.body)), self.body]
+        header = parsing.VarInt.emit(self.uncompressed_length)
+        return [parsing.VarInt.emit(len(header) + len(self.body)),
+                header, self.body]
+
+    def __str__(self):
+        return unicode(self).encode("utf8")
+
+    def __unicode__(self):
+        return "Raw %s Packet (id: 0x%02x length: %d)" % (
+            self._name, self.id, len(self.body))
+
+
 class BufferView(protocol.PacketData):
     pass
 
 
 class CompressedData(protocol.PacketData):
-    CHUNK_SIZE = 128
+    """
+    Inflates packet data as far as it's read.
+
+    The data is decompressed into a bytearray which starts just large enough
+    for the first read and at least doubles whenever it's too small, so
+    reading the packet id only inflates a few bytes and reading a whole
+    packet takes linear time. Views returned earlier keep referencing the
+    buffer they were taken from.
+    """
+    # Compressed bytes passed to zlib at once, which bounds the size of the
+    # unconsumed_tail it copies on every call
+    INPUT_SIZE = 1 << 16
 
     def __init__(self, data, uncompressed_length):
         self.data = data
         self.length = uncompressed_length
 
         self.read_pos = 0
-        self.decompressed_data = b''
+        # Number of bytes inflated into buffer so far
+        self.inflated = 0
+        self.buffer = bytearray()
+        self._view = memoryview(self.buffer)
         self.decompress_object = zlib.decompressobj()
+        # compression.Job inflating the whole data in the background
+        self._job = None
 
-    def decompress(self, length):
-        while length + self.read_pos > len(self.decompressed_data):
-            limit = min(self.CHUNK_SIZE,
-                        len(self.data) - self.data.read_pos)
-
-            if limit <= 0:
-                raise IOError("Buffer underflow")
+    def inflate_on(self, workers):
+        """Inflates the whole data on a compression.WorkerPool"""
+        self._job = workers.submit(self._inflate, self.length)
 
-            chunk = self.data.read_bytes(limit).tobytes()
+    def _grow(self, size):
+        buffer = bytearray(size)
+        buffer[:self.inflated] = self._view[:self.inflated]
+        self.buffer = buffer
+        self._view = memoryview(buffer)
 
-            if self.decompress_object.unconsumed_tail:
-                chunk = self.decompress_object.unconsumed_tail + chunk
-
-            self.decompressed_data += self.decompress_object.decompress(chunk)
+    def decompress(self, length):
+        if self._job is not None:
+            job, self._job = self._job, None
+            job.result()
+        self._inflate(length)
+
+    def _inflate(self, length):
+        needed = self.read_pos + length
+        if needed <= self.inflated:
+            return
+        target = min(self.length, max(needed, 2 * self.inflated))
+        if target > len(self.buffer):
+            self._grow(target)
+
+        decompress_object = self.decompress_object
+        while self.inflated < needed:
+            chunk = decompress_object.unconsumed_tail
+            if not chunk:
+                limit = min(self.INPUT_SIZE,
+                            len(self.data) - self.data.read_pos)
+                if limit <= 0:
+                    raise IOError("Buffer underflow")
+                chunk = self.data.read_bytes(limit).tobytes()
+
+            inflated = decompress_object.decompress(
+                chunk, target - self.inflated)
+            self.buffer[self.inflated:self.inflated + len(inflated)] = \
+                inflated
+            self.inflated += len(inflated)
 
     def read(self):
         self.decompress(self.length - self.read_pos)
-        return memoryview(self.decompressed_data)
+        return self._view[:self.length]
 
     def read_bytes(self, n=None):
         if n is None:
@@ -268,8 +781,38 @@ class CompressedData(protocol.PacketData):
         self.decompress(n)
         original_position = self.read_pos
         self.read_pos += n
-        return memoryview(self.decompressed_data)[
-            original_position:self.read_pos]
+        return self._view[original_position:self.read_pos]
+
+    def skip(self, n):
+        if self.length < self.read_pos + n:
+            raise IOError("Buffer underflow")
+        self.decompress(n)
+        self.read_pos += n
+
+    def view(self, start, end):
+        return self._view[start:end]
+
+    def view_segments(self, start, end):
+        # The end may not have been read yet
+        self.decompress(self.length - self.read_pos)
+        return [self._view[start:end]]
+
+    def read_varint(self):
+        self.decompress(min(5, self.length - self.read_pos))
+        try:
+            value, self.read_pos = parsing.decode_varint(
+                self._view[:self.inflated], self.read_pos)
+        except IndexError:
+            raise IOError("Buffer underflow")
+        return value
+
+    def unpack(self, struct_):
+        if self.length < self.read_pos + struct_.size:
+            raise IOError("Buffer underflow")
+        self.decompress(struct_.size)
+        values = struct_.unpack_from(self.buffer, self.read_pos)
+        self.read_pos += struct_.size
+        return values
 
-    def read_compressed(self):
+    def read_compressed(self, compressor=None):
         return self.data.read()
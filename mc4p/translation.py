@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+
+# This source file is part of mc4p,
+# the Minecraft Portable Protocol-Parsing Proxy.
+
+# This program is free software. It comes without any warranty, to
+# the extent permitted by applicable law. You can redistribute it
+# and/or modify it under the terms of the Do What The Fuck You Want
+# To Public License, Version 2, as published by Sam Hocevar. See
+# http://www.wtfpl.net/txt/copying/ for more details
+
+"""
+Translates packets between protocol versions.
+
+Packets are matched by direction, state and class name, their fields by
+name. Packets with the same wire layout in both versions are passed through
+as their original bytes with just the packet id replaced, all others are
+copied field by field by a function compiled for each pair of packets.
+Packets gaining fields need a translation registered for them.
+"""
+
+from __future__ import absolute_import, unicode_literals
+
+import logging
+
+from mc4p import parsing
+from mc4p import protocol
+
+logger = logging.getLogger("translation")
+
+# Fields whose values may be substructures referencing their packet
+_STRUCTURED_FIELDS = (parsing.Array, parsing.SubFields, parsing.Switch,
+                      parsing.Optional)
+
+
+def packet_layout(packet):
+    """
+    Returns a hashable description of a packet's wire format and the names
+    of its fields, or None if it can't be told. Packets with the same layout
+    read the same bytes into the same fields.
+    """
+    signatures = tuple((name, field.signature())
+                       for name, field in packet._fields.iteritems())
+    if any(signature is None for name, signature in signatures):
+        return None
+    return signatures
+
+
+def _adopt(value, parent):
+    if isinstance(value, parsing._SubStructure):
+        value._parent = parent
+    return value
+
+
+def compile_passthrough(source, target):
+    """
+    Generates a function translating source packets to target packets with
+    the same wire layout, by reusing the source packet's data.
+    """
+    source_id_length = len(parsing.VarInt.emit(source.id))
+    target_id = parsing.VarInt.emit(target.id)
+
+    def passthrough(packet):
+        if packet._dirty:
+            packet._encode()
+        body = packet._data.read()[source_id_length:]
+        data = protocol.SegmentedData([target_id, body])
+        data.skip(len(target_id))
+        return target(_data=data, _strict_protocol=packet._strict_protocol)
+
+    return passthrough
+
+
+def compile_copier(source, target):
+    """
+    Generates a straight-line function translating source packets to target
+    packets by copying the values of fields with the same name. The source
+    packet must have all fields of the target packet.
+    """
+    namespace = {
+        str("_new"): target.__new__,
+        str("_target"): target,
+        str("_adopt"): _adopt,
+    }
+    lines = [
+        "def copy(packet):",
+        "    if not packet._parsed:",
+        "        packet._parse()",
+        "    new = _new(_target)",
+        "    new._reset(None, packet._strict_protocol)",
+        "    new._parsed = True",
+        "    new._dirty = True",
+    ]
+    for i, (name, field) in enumerate(target._fields.iteritems()):
+        setter = str("_set_%d" % i)
+        namespace[setter] = target.__dict__[target._storage[name]].__set__
+        getter = str("_get_%d" % i)
+        namespace[getter] = source.__dict__[source._storage[name]].__get__
+        value = "%s(packet)" % getter
+        if isinstance(field, _STRUCTURED_FIELDS):
+            value = "_adopt(%s, new)" % value
+        lines.append("    %s(new, %s)" % (setter, value))
+    lines.append("    return new")
+    return parsing._compile_function("copy", lines, namespace)
+
+
+class Translator(object):
+    """
+    Translates packets of the source protocol to the target protocol, which
+    are Protocol objects like the ones returned by get_protocol_version.
+
+    The translation of each packet class is compiled on first use. Custom
+    translations for packets whose fields changed in incompatible ways can
+    be registered with register_translation.
+    """
+    def __init__(self, source, target):
+        self.source = source
+        self.target = target
+        self._translations = {}
+
+    @classmethod
+    def for_versions(cls, source_version, target_version):
+        return cls(protocol.get_protocol_version(source_version),
+                   protocol.get_protocol_version(target_version))
+
+    def register_translation(self, packet, function):
+        """
+        Translates source packets of the class packet with function, which
+        takes the packet and returns the target packet, or None to drop it.
+        """
+        self._translations[packet] = function
+
+    def target_packet(self, packet):
+        """Returns the target packet class matching a source packet class"""
+        context = self.target.directions[packet._direction].states[
+            packet._state]
+        for target in context.packets.itervalues():
+            if target.__name__ == packet.__name__:
+                return target
+
+    def _compile(self, packet):
+        target = self.target_packet(packet)
+        if target is None:
+            logger.debug("No translation for %s to protocol %d",
+                         packet.__name__, self.target.version)
+            return None
+        layout = packet_layout(packet)
+        if layout is not None and layout == packet_layout(target):
+            return compile_passthrough(packet, target)
+        missing = [name for name in target._fields
+                   if name not in packet._fields]
+        if missing:
+            # The values would have to be made up, and None can't be encoded
+            logger.warning("No translation for %s to protocol %d, which "
+                           "adds the fields %s; register one",
+                           packet.__name__, self.target.version,
+                           ", ".join(missing))
+            return None
+        return compile_copier(packet, target)
+
+    def translate(self, packet):
+        """
+        Returns the target protocol version of a packet, or None if it has
+        no counterpart there or that has fields it can't be given without a
+        registered translation. Raw frames are parsed first.
+        """
+        if not isinstance(packet, protocol.Packet):
+            packet = packet.parse()
+        cls = packet.__class__
+        if cls._context is None:
+            # Unknown packets can't be matched by name
+            return None
+        try:
+            translate = self._translations[cls]
+        except KeyError:
+            translate = self._translations[cls] = self._compile(cls)
+        if translate is None:
+            return None
+        return translate(packet)
@@ -11,6 +11,7 @@
 
 from __future__ import absolute_import, unicode_literals
 
+import json
 import re
 
 
@@ -33,6 +34,18 @@ class StringEnum(object):
         return iter(self._values)
 
 
+class BoundedCache(dict):
+    """A dict which forgets all entries once it holds maxsize of them"""
+    def __init__(self, maxsize):
+        super(BoundedCache, self).__init__()
+        self.maxsize = maxsize
+
+    def __setitem__(self, key, value):
+        if len(self) >= self.maxsize:
+            self.clear()
+        super(BoundedCache, self).__setitem__(key, value)
+
+
 def combine_memoryview(*data_parts):
     return b"".join(
         part.tobytes() if isinstance(part, memoryview) else part
@@ -40,6 +53,72 @@ def combine_memoryview(*data_parts):
     )
 
 
+# Maximum number of buffers passed to a single sendmsg call
+IOV_MAX = 1024
+# Without sendmsg, buffers of at least this many bytes are sent on their own
+# instead of being copied together with the others
+COALESCE_LIMIT = 1 << 15
+
+
+def send_segments(sock, segments):
+    """
+    Sends a list of buffers with vectored I/O, so they don't have to be
+    joined first. Sockets without sendmsg get runs of small buffers copied
+    once into a single one, and large buffers as they are.
+    Returns the number of send calls it took.
+    """
+    sendmsg = getattr(sock, "sendmsg", None)
+    if sendmsg is None:
+        return _send_coalesced(sock, segments)
+
+    segments = [memoryview(segment) for segment in segments if len(segment)]
+    calls = 0
+    i = 0
+    while i < len(segments):
+        sent = sendmsg(segments[i:i + IOV_MAX])
+        calls += 1
+        while sent:
+            if sent >= len(segments[i]):
+                sent -= len(segments[i])
+                i += 1
+            else:
+                segments[i] = segments[i][sent:]
+                sent = 0
+    return calls
+
+
+def _send_coalesced(sock, segments):
+    calls = 0
+    run = []
+    for segment in segments:
+        length = len(segment)
+        if length >= COALESCE_LIMIT:
+            if run:
+                _send_run(sock, run)
+                calls += 1
+                run = []
+            sock.sendall(segment)
+            calls += 1
+        elif length:
+            run.append(segment)
+    if run:
+        _send_run(sock, run)
+        calls += 1
+    return calls
+
+
+def _send_run(sock, run):
+    """Sends a list of buffers copied into a single one"""
+    if len(run) == 1:
+        sock.sendall(run[0])
+        return
+    # Appending copies straight out of memoryviews, unlike joining them
+    buf = bytearray()
+    for segment in run:
+        buf += segment
+    sock.sendall(buf)
+
+
 COLOR_PATTERN = re.compile("§.")
 
 
@@ -73,5 +152,20 @@ def parse_chat(chat_obj):
     return strip_color(text)
 
 
+_CHAT_CACHE = BoundedCache(4096)
+
+
+def parse_chat_json(raw):
+    """
+    Like parse_chat, for the raw UTF-8 encoded JSON of a chat object.
+    Results are memoized by the raw bytes.
+    """
+    try:
+        return _CHAT_CACHE[raw]
+    except KeyError:
+        text = _CHAT_CACHE[raw] = parse_chat(json.loads(raw))
+        return text
+
+
 def strip_color(string):
     return COLOR_PATTERN.sub("", string)
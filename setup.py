@@ -28,7 +28,7 @@ setuptools.setup(
         "redis",
     ),
     extras_require={
-        'performance': ("pycrypto",),
+        'performance': ("pycrypto", "numpy", "cryptography"),
         'formatting': ("blessings",)
     }
 )